@@ -1,85 +1,65 @@
-import cv2
-import time
-import subprocess
 import logging
 from datetime import datetime
-from src.config import (
-    LOW_LIGHT_CHECK_INTERVAL,
-    LOW_LIGHT_THRESHOLD,
-    CAMERA_ALIGNMENT_HOURS,
-)
+import yaml
+from src.config import CAMERA_ALIGNMENT_HOURS
 from src.motion_detector import detect_motion
 from src.camera_position_check import check_camera_alignment
+from src.camera_broker import open_camera, wait_for_camera
+from src.supervisor import ManagedProcess, Supervisor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s - %(message)s')
 
-# Convert interval from minutes to seconds
-LOW_LIGHT_CHECK_SECONDS = LOW_LIGHT_CHECK_INTERVAL * 60
-
-
-def is_low_light(frame, threshold=LOW_LIGHT_THRESHOLD):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    return gray.mean() < threshold
-
-
-def read_camera_frame():
-    cap = cv2.VideoCapture(0)
-    ret, frame = cap.read()
-    cap.release()
-    return ret, frame
-
-
-def run_mode(script_name):
-    return subprocess.Popen([
-        "python", f"src/{script_name}"
-    ], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-
-
-def should_check_alignment(now, last_check_time):
-    return now.hour in CAMERA_ALIGNMENT_HOURS and (not last_check_time or now.date() != last_check_time.date())
+# One resident counter handles both day and night; it switches light mode in place
+COUNTER_SCRIPT = "src/counter.py"
+# Broker and heartbeat settings come from the counter's own config, so both sides agree
+COUNTER_CONFIG = "src/config.yaml"
+# The counter is restarted after this many heartbeat intervals without a heartbeat
+HEARTBEAT_MISSES = 3
+# Owns the camera and shares frames, so the counter and the checks below never open it
+BROKER_SCRIPT = "src/camera_broker.py"
+# While motion blocks the alignment check, retry this often until the hour is over
+ALIGNMENT_RETRY_SECONDS = 60
+
+with open(COUNTER_CONFIG, "r") as f:
+    config = yaml.safe_load(f)
+
+
+def run_alignment_check():
+    """Run the camera alignment check only if there is no motion; True if it ran."""
+    cap = open_camera(config['camera_shm_name'])
+    try:
+        moving = detect_motion(cap)
+    finally:
+        cap.release()
+    if moving:
+        logging.info("Skipping alignment check due to motion.")
+        return False
+    logging.info("Running camera alignment check.")
+    check_camera_alignment()
+    return True
 
 
 def main():
-    current_mode = None
-    process = None
-    last_switch = time.time() - LOW_LIGHT_CHECK_SECONDS
-    last_alignment_check = None
-
-    while True:
-        now = datetime.now()
+    supervisor = Supervisor()
 
-        # Run camera alignment check twice a day (e.g. 6h, 18h) only if no motion
-        if should_check_alignment(now, last_alignment_check):
-            cap = cv2.VideoCapture(0)
-            if not detect_motion(cap):
-                logging.info("Running camera alignment check.")
-                check_camera_alignment()
-                last_alignment_check = now
-            else:
-                logging.info("Skipping alignment check due to motion.")
-            cap.release()
+    if config['camera_broker']:
+        supervisor.add_process(ManagedProcess("camera broker", BROKER_SCRIPT))
+        if not wait_for_camera(config['camera_shm_name']):
+            logging.error("Camera broker did not start publishing frames.")
 
-        # Switch between normal and lowlight mode if needed
-        if time.time() - last_switch >= LOW_LIGHT_CHECK_SECONDS:
-            ret, frame = read_camera_frame()
-            if not ret:
-                logging.error("Cannot read from camera.")
-                time.sleep(60)
-                continue
+    supervisor.add_process(ManagedProcess("counter", COUNTER_SCRIPT,
+                                          heartbeat_timeout=HEARTBEAT_MISSES * config['heartbeat_seconds']))
 
-            low_light = is_low_light(frame)
-            new_mode = "lowlight_counter.py" if low_light else "counter.py"
+    # Camera alignment check at the given hours (e.g. 6h, 14h), retried while there is motion
+    def alignment_job():
+        if not run_alignment_check() and datetime.now().hour in CAMERA_ALIGNMENT_HOURS:
+            supervisor.call_later(ALIGNMENT_RETRY_SECONDS, start_alignment)
 
-            if new_mode != current_mode:
-                if process:
-                    process.terminate()
-                logging.info(f"Switching to {new_mode} mode.")
-                process = run_mode(new_mode)
-                current_mode = new_mode
-                last_switch = time.time()
+    start_alignment = Supervisor.in_background(alignment_job, "alignment check")
+    supervisor.call_at_hours(CAMERA_ALIGNMENT_HOURS, start_alignment)
 
-        time.sleep(60)
+    supervisor.run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+# alignment.py - Camera drift from the reference view, estimated on a downscaled pyramid level
+# ORB features give translation, rotation and scale; phase correlation covers featureless scenes.
+
+import os
+import math
+import cv2
+import yaml
+import numpy as np
+
+MAX_WIDTH = 320  # frames are halved with pyrDown until no wider than this
+MIN_INLIERS = 12
+
+
+class Alignment:
+    """Similarity transform taking reference-view pixels to current-view pixels (full resolution)."""
+
+    def __init__(self, matrix: np.ndarray, confidence: float, method: str):
+        self.matrix = np.asarray(matrix, dtype=np.float64).reshape(2, 3)
+        self.confidence = confidence
+        self.method = method
+
+    @property
+    def dx(self) -> float:
+        return float(self.matrix[0, 2])
+
+    @property
+    def dy(self) -> float:
+        return float(self.matrix[1, 2])
+
+    @property
+    def scale(self) -> float:
+        return math.hypot(self.matrix[0, 0], self.matrix[1, 0])
+
+    @property
+    def rotation(self) -> float:
+        """Rotation in degrees, clockwise on screen (y points down)."""
+        return math.degrees(math.atan2(self.matrix[1, 0], self.matrix[0, 0]))
+
+    def transform(self, points) -> np.ndarray:
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        return cv2.transform(points, self.matrix).reshape(-1, 2)
+
+    def drift(self, frame_size: tuple, base: "Alignment | None" = None) -> float:
+        """Largest distance, in pixels, between where this and base (else the reference view)
+        put a corner of a (width, height) frame."""
+        w, h = frame_size
+        corners = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float64)
+        other = corners if base is None else base.transform(corners)
+        return float(np.max(np.linalg.norm(self.transform(corners) - other, axis=1)))
+
+
+def _downscale(frame: np.ndarray, max_width: int) -> tuple[np.ndarray, float]:
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    scale = 1.0
+    while gray.shape[1] > max_width:
+        gray = cv2.pyrDown(gray)
+        scale /= 2
+    return gray, scale
+
+
+def _match_features(reference: np.ndarray, current: np.ndarray, min_inliers: int):
+    orb = cv2.ORB_create(nfeatures=500)
+    kp_ref, des_ref = orb.detectAndCompute(reference, None)
+    kp_cur, des_cur = orb.detectAndCompute(current, None)
+    if des_ref is None or des_cur is None:
+        return None, 0.0
+    matches = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True).match(des_ref, des_cur)
+    if len(matches) < min_inliers:
+        return None, 0.0
+    src = np.float32([kp_ref[m.queryIdx].pt for m in matches])
+    dst = np.float32([kp_cur[m.trainIdx].pt for m in matches])
+    matrix, inliers = cv2.estimateAffinePartial2D(src, dst, method=cv2.RANSAC, ransacReprojThreshold=2.0)
+    if matrix is None or int(inliers.sum()) < min_inliers:
+        return None, 0.0
+    return matrix, float(inliers.mean())
+
+
+def _phase_correlate(reference: np.ndarray, current: np.ndarray):
+    window = cv2.createHanningWindow(reference.shape[::-1], cv2.CV_32F)
+    (dx, dy), response = cv2.phaseCorrelate(np.float32(reference), np.float32(current), window)
+    return np.array([[1.0, 0.0, dx], [0.0, 1.0, dy]]), float(response)
+
+
+def estimate_alignment(reference: np.ndarray, current: np.ndarray, max_width: int = MAX_WIDTH,
+                       min_inliers: int = MIN_INLIERS) -> Alignment:
+    """Estimate how the camera view moved between the reference and the current frame.
+
+    Both frames are reduced to grey and halved until no wider than max_width, so the cost
+    does not grow with the camera resolution. ORB matches with a RANSAC similarity fit give
+    translation, rotation and scale, with the inlier share as confidence. When too few
+    features match (fog, night, a blank wall), phase correlation gives translation only,
+    with its peak response as confidence.
+    """
+    ref, scale = _downscale(reference, max_width)
+    cur, _ = _downscale(current, max_width)
+    matrix, confidence = _match_features(ref, cur, min_inliers)
+    method = "orb"
+    if matrix is None:
+        matrix, confidence = _phase_correlate(ref, cur)
+        method = "phase"
+    # Rotation and scale are the same at every level; the shift scales with the image
+    matrix[:, 2] /= scale
+    return Alignment(matrix, confidence, method)
+
+
+def save_alignment(path: str, alignment: Alignment) -> None:
+    # Written aside and renamed, so the counter never reads a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        yaml.safe_dump({"matrix": alignment.matrix.tolist(), "confidence": alignment.confidence,
+                        "method": alignment.method}, f)
+    os.replace(tmp_path, path)
+
+
+def load_alignment(path: str | None) -> Alignment | None:
+    """The correction saved by the alignment check, or None if there is none."""
+    try:
+        with open(path, "r") as f:
+            data = yaml.safe_load(f)
+    except (FileNotFoundError, TypeError):
+        return None
+    return Alignment(data["matrix"], data["confidence"], data["method"])
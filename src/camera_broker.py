@@ -0,0 +1,280 @@
+# camera_broker.py - One process owns the camera and shares its frames with the others
+# Frames go into a shared-memory ring buffer; any number of local readers (counter,
+# brightness, motion and alignment checks) map it without opening the device.
+
+import sys
+import time
+import signal
+import cv2
+import yaml
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+MAGIC = 0x43414D494E41  # "CAMINA"
+HEADER_FIELDS = 8  # magic, slots, height, width, channels, latest sequence, fps x 1000, generation
+ALIGN = 64
+POLL_SECONDS = 0.002
+RESYNC_SECONDS = 0.5  # with no new frame for this long, a reader checks for a restarted broker
+CLOSED = -1  # generation of a ring whose broker has shut down
+
+_owned = set()  # rings created by this process
+
+
+def _align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _attach_untracked(name: str) -> shared_memory.SharedMemory:
+    """Map an existing block without this process's resource tracker taking ownership of it.
+
+    The tracker unlinks every block its process registered when that process exits, which
+    would delete the broker's ring whenever a reader stopped. Python 3.13 added track=False;
+    before that, the registration that SharedMemory() makes has to be undone by hand, and
+    the tracker knows the block by its private, "/"-prefixed name.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class FrameRing:
+    """Fixed-size ring of frames in a named shared-memory block.
+
+    Layout: an int64 header, then per-slot sequence numbers and timestamps, then the frames.
+    The writer marks a slot -1 while copying into it and stamps it with the frame's sequence
+    number when done, then publishes that number in the header. A reader that sees the same
+    sequence in the slot before and after using it knows the frame was not overwritten.
+    Each ring gets a new generation number, and the broker sets it to CLOSED when it shuts
+    down, so readers can tell when to attach to a restarted broker's ring.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if self.header[0] != MAGIC:
+            raise ValueError(f"Shared memory '{shm.name}' is not a camera ring")
+        slots, height, width, channels = (int(v) for v in self.header[1:5])
+        self.slots = slots
+        self.shape = (height, width, channels)
+        offset = _align(HEADER_FIELDS * 8)
+        self.slot_seq = np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset = _align(offset + slots * 8)
+        self.slot_time = np.ndarray((slots,), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset = _align(offset + slots * 8)
+        self.frames = np.ndarray((slots, *self.shape), dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+    @staticmethod
+    def nbytes(slots: int, shape: tuple) -> int:
+        return _align(HEADER_FIELDS * 8) + 2 * _align(slots * 8) + slots * int(np.prod(shape))
+
+    @classmethod
+    def create(cls, name: str, shape: tuple, slots: int = 4, fps: float = 0.0) -> "FrameRing":
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls.nbytes(slots, shape))
+        _owned.add(name)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = (MAGIC, slots, *shape, -1, int(fps * 1000), time.time_ns())
+        ring = cls(shm, owner=True)
+        ring.slot_seq[:] = -1
+        del header
+        return ring
+
+    @classmethod
+    def attach(cls, name: str) -> "FrameRing":
+        """Map an existing ring; raises FileNotFoundError if no broker has created it."""
+        # Only the broker unlinks the ring
+        shm = shared_memory.SharedMemory(name=name) if name in _owned else _attach_untracked(name)
+        return cls(shm, owner=False)
+
+    @property
+    def latest_seq(self) -> int:
+        return int(self.header[5])
+
+    @property
+    def fps(self) -> float:
+        return self.header[6] / 1000
+
+    @property
+    def generation(self) -> int:
+        return int(self.header[7])
+
+    def write(self, frame: np.ndarray) -> int:
+        seq = self.latest_seq + 1
+        slot = seq % self.slots
+        self.slot_seq[slot] = -1
+        np.copyto(self.frames[slot], frame)
+        self.slot_time[slot] = time.time()
+        self.slot_seq[slot] = seq
+        self.header[5] = seq
+        return seq
+
+    def view(self, seq: int) -> np.ndarray | None:
+        """Zero-copy view of frame seq, or None if it is gone. Check valid(seq) after using it."""
+        return self.frames[seq % self.slots] if self.valid(seq) else None
+
+    def valid(self, seq: int) -> bool:
+        return seq >= 0 and int(self.slot_seq[seq % self.slots]) == seq
+
+    def copy(self, seq: int, out: np.ndarray | None = None) -> np.ndarray | None:
+        """Copy of frame seq, or None if it was overwritten before or during the copy."""
+        frame = self.view(seq)
+        if frame is None:
+            return None
+        if out is None:
+            out = frame.copy()
+        else:
+            np.copyto(out, frame)
+        return out if self.valid(seq) else None
+
+    def close(self) -> None:
+        if self.owner:
+            self.header[7] = CLOSED  # readers still mapping this block move to the next broker's
+        # Views into the buffer must be released before the mapping can be closed
+        self.header = self.slot_seq = self.slot_time = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            _owned.discard(self.shm.name)
+
+
+class SharedCamera:
+    """Reader of a broker's ring with the cv2.VideoCapture calls the counters use.
+
+    read() waits for a frame newer than the last one returned, so a consumer is paced by
+    the camera as if it held the device. latest() returns the newest frame without waiting.
+    If the broker restarts (the supervisor restarts it when it dies), the reader attaches to
+    the new ring and carries on; timeout should cover the broker's restart.
+    """
+
+    def __init__(self, name: str, timeout: float = 10.0):
+        self.name = name
+        self.ring = FrameRing.attach(name)
+        self.timeout = timeout
+        self.last_seq = -1
+
+    def isOpened(self) -> bool:
+        return self.ring is not None
+
+    def read(self, copy: bool = True) -> tuple[bool, np.ndarray | None]:
+        """Next frame as (ret, frame); with copy=False the frame is a view into the ring."""
+        deadline = time.monotonic() + self.timeout
+        resync_at = time.monotonic() + RESYNC_SECONDS
+        while time.monotonic() < deadline:
+            seq = self.ring.latest_seq
+            if seq < self.last_seq:
+                self.last_seq = -1  # the ring was reset
+            if seq > self.last_seq:
+                frame = self.ring.copy(seq) if copy else self.ring.view(seq)
+                if frame is not None:
+                    self.last_seq = seq
+                    return True, frame
+            if self.ring.generation == CLOSED or time.monotonic() >= resync_at:
+                self._resync()
+                resync_at = time.monotonic() + RESYNC_SECONDS
+            time.sleep(POLL_SECONDS)
+        return False, None
+
+    def _resync(self) -> None:
+        """Move to the ring now published under our name, if a restarted broker has made a new one."""
+        try:
+            ring = FrameRing.attach(self.name)
+        except (FileNotFoundError, ValueError):
+            return  # the broker is still starting
+        if ring.generation == self.ring.generation:
+            ring.close()
+            return
+        self.ring.close()
+        self.ring = ring
+        self.last_seq = -1
+        print(f"[INFO] Camera broker restarted; reading its new ring '{self.name}'.")
+
+    def latest(self, copy: bool = True) -> tuple[bool, np.ndarray | None]:
+        if self.ring.generation == CLOSED:
+            self._resync()
+        seq = self.ring.latest_seq
+        frame = self.ring.copy(seq) if copy else self.ring.view(seq)
+        return frame is not None, frame
+
+    def get(self, prop: int) -> float:
+        height, width = self.ring.shape[:2]
+        return {cv2.CAP_PROP_FPS: self.ring.fps, cv2.CAP_PROP_FRAME_WIDTH: width,
+                cv2.CAP_PROP_FRAME_HEIGHT: height}.get(prop, 0.0)
+
+    def set(self, prop: int, value: float) -> bool:
+        return False  # the broker owns the device settings
+
+    def release(self) -> None:
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+def open_camera(name: str = "camina_camera", source=0, width: int | None = None, height: int | None = None):
+    """The broker's shared camera if one is running, else the device itself."""
+    try:
+        return SharedCamera(name)
+    except FileNotFoundError:
+        cap = cv2.VideoCapture(source)
+        if width and height:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        return cap
+
+
+def wait_for_camera(name: str = "camina_camera", timeout: float = 10.0) -> bool:
+    """Wait until a broker has published its ring (e.g. right after starting it)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            SharedCamera(name).release()
+            return True
+        except (FileNotFoundError, ValueError):
+            time.sleep(0.1)
+    return False
+
+
+class CameraBroker:
+    """Reads the camera continuously and publishes every frame into a FrameRing."""
+
+    def __init__(self, source, width: int, height: int, name: str = "camina_camera", slots: int = 4):
+        self.cap = cv2.VideoCapture(source)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        ret, frame = self.cap.read()
+        if not ret:
+            self.cap.release()
+            raise RuntimeError(f"Cannot read from camera {source}")
+        self.ring = FrameRing.create(name, frame.shape, slots, fps=self.cap.get(cv2.CAP_PROP_FPS))
+        self.ring.write(frame)
+
+    def run(self) -> None:
+        try:
+            while True:
+                ret, frame = self.cap.read()
+                if not ret:
+                    print("[WARNING] Camera stopped returning frames.")
+                    break
+                self.ring.write(frame)
+        finally:
+            self.cap.release()
+            self.ring.close()
+
+
+if __name__ == "__main__":
+    # The supervisor stops the broker with SIGTERM; exit through run()'s cleanup so the ring
+    # is marked CLOSED and readers move to the next broker's ring at once
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with open("src/config.yaml", "r") as f:
+        config = yaml.safe_load(f)
+    broker = CameraBroker(config['camera_source'], config['frame_width'], config['frame_height'],
+                          name=config['camera_shm_name'], slots=config['camera_ring_slots'])
+    print(f"[INFO] Camera broker publishing {broker.ring.shape} frames to '{config['camera_shm_name']}'")
+    broker.run()
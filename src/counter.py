@@ -1,10 +1,21 @@
 import os
+import sys
+import signal
 import cv2
 import yaml
-import numpy as np
 from datetime import datetime
-from ultralytics import YOLO
 from sort import Sort
+from pipeline import Pipeline
+from motion import MotionGate, MotionSleep
+from scheduler import FrameSkipScheduler
+from governor import ResolutionGovernor
+from lightmode import LightModeSwitcher, LuminanceEstimator
+from detectors import detector_from_config, inference_imgsz, model_key, variant_config
+from roi import AlignmentWatcher
+from camera_broker import SharedCamera
+from supervisor import Heartbeat
+from counting import CountingState
+from logsink import LogSink
 
 # Load config from YAML
 with open("src/config.yaml", "r") as f:
@@ -14,87 +25,173 @@ with open("src/config.yaml", "r") as f:
 with open("src/classes.yaml", "r") as f:
     CLASSES = yaml.safe_load(f)
 
+# How often to look for a drift correction saved by the alignment check
+ALIGNMENT_CHECK_SECONDS = 60
+
 
 class ModalShareCounter:
     def __init__(self):
-        self.model = YOLO(config['model'])
-        self.tracker = Sort()
+        variants = config['model_variants'] if config['governor'] else [
+            {'imgsz': config['imgsz'], 'model': config[model_key(config['detector'])]}]
+        variant_configs = [variant_config(config, variant) for variant in variants]
+        if config['detector'] == 'ultralytics':
+            # Ultralytics runs one model at any imgsz, so every variant shares it and a switch
+            # only changes imgsz (it has no thread setting, so num_threads does not apply)
+            self.detectors = [detector_from_config(variant_configs[0], CLASSES)]
+            self.variant_imgsz = [inference_imgsz(cfg) for cfg in variant_configs]
+        else:
+            # Exports have a fixed input size: each variant's is loaded up front, so a switch is instant
+            self.detectors = [detector_from_config(cfg, CLASSES) for cfg in variant_configs]
+            self.variant_imgsz = None
+        self.detector = self.detectors[0]
+        self.governor = None
+        if config['governor']:
+            self.governor = ResolutionGovernor(
+                variants,
+                latency_budget=config['governor_latency_ms'] / 1000,
+                temp_path=config['governor_temp_path'],
+                hot_temp=config['governor_hot_temp'],
+                cool_temp=config['governor_cool_temp'],
+                dwell_seconds=config['governor_dwell_seconds'],
+            )
+        self.tracker = Sort(
+            solver=config['association_solver'],
+            high_threshold=config['confidence_threshold'],
+            low_threshold=config['track_low_threshold'],
+        )
+        # Day and night run in this one process: switching keeps the model, tracks and counts
+        self.light = LightModeSwitcher(
+            {
+                'normal': {
+                    'preprocess': 'none',
+                    'confidence_threshold': config['confidence_threshold'],
+                    'track_low_threshold': config['track_low_threshold'],
+                },
+                'low_light': config['low_light'],
+            },
+            enter_threshold=config['low_light_threshold'],
+            exit_threshold=config['low_light_exit_threshold'],
+            dwell_seconds=config['light_min_dwell_minutes'] * 60,
+        )
         self.cap = self._init_camera()
+        self.motion_gate = None
+        if config['motion_gate']:
+            self.motion_gate = MotionGate(
+                threshold=config['motion_threshold'],
+                min_fraction=config['motion_min_fraction'],
+            )
+        self.motion_sleep = None
+        if config['motion_gate'] and config['motion_sleep']:
+            self.motion_sleep = MotionSleep(config['sleep_after_seconds'], config['sleep_fps'])
+        self.scheduler = None
+        if config['adaptive_skip']:
+            self.scheduler = FrameSkipScheduler(
+                fps=self.cap.get(cv2.CAP_PROP_FPS) or config['camera_fps'],
+                min_skip=config['min_frame_skip'],
+                max_skip=config['max_frame_skip'],
+                cpu_budget=config['cpu_budget'],
+            )
+        self.heartbeat = Heartbeat(config['heartbeat_seconds'])
         self.frame_count = 0
-        self.seen_ids = {cls: set() for cls in CLASSES.values()}
-        self.counts = {cls: 0 for cls in CLASSES.values()}
-        self.class_id_mapping = {cls: {} for cls in CLASSES.values()}
-        self.class_id_counters = {cls: 1 for cls in CLASSES.values()}
+        # Keyed by the model's own class ids, which a pruned export renumbers
+        self.state = CountingState(self.detector.classes)
         self.last_log_minute = None
+        # Log lines are buffered and written in batches to spare the SD card
+        self.log = None
+        if config['logging_enabled']:
+            self.log = LogSink('data', config['location'], config['camera_id'], log_format=config['log_format'],
+                               flush_seconds=config['log_flush_seconds'], fsync=config['log_fsync'])
+        self.alignment = AlignmentWatcher(config, ALIGNMENT_CHECK_SECONDS)
 
     def _init_camera(self):
+        if config['camera_broker']:
+            # The broker process owns the device; read its frames from shared memory
+            return SharedCamera(config['camera_shm_name'])
         # cap = cv2.VideoCapture(config['camera_index'])
         cap = cv2.VideoCapture("test_video/test.mov")
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, config['frame_width'])
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config['frame_height'])
         return cap
 
-    def _get_class_label(self, bbox, class_map):
-        return class_map.get(
-            min(class_map.keys(), key=lambda b: np.linalg.norm(np.array(b) - np.array(bbox))),
-            None
-        )
-
     def run(self):
+        pipeline = Pipeline(
+            self.cap,
+            self.detector,
+            frame_skip=config['frame_skip'],
+            depth=config['pipeline_depth'],
+            policy=config['pipeline_policy'],
+            gate=self.motion_gate,
+            sleep=self.motion_sleep,
+            tracks_alive=lambda: len(self.tracker.trackers) > 0,
+            luminance=LuminanceEstimator(time_constant=config['light_smoothing_seconds']),
+        )
+        pipeline.start()
+        last_index = None
         try:
-            while True:
-                ret, frame = self.cap.read()
-                if not ret:
-                    break
-
-                if self.frame_count % config['frame_skip'] == 0:
-                    self._process_frame(frame)
-
-                self.frame_count += 1
+            for index, frame, detections in pipeline:
+                # Frames dropped under load widen the gap; the tracker predicts across it
+                dt = config['frame_skip'] if last_index is None else index - last_index
+                last_index = index
+                self.frame_count = index + 1
+                if self.light.update(pipeline.luminance.value):
+                    self._switch_light_mode(pipeline)
+                self._process_frame(frame, detections, dt)
+                self.heartbeat.beat(f"frame {index}")
+                if (roi := self.alignment.poll()) is not None:
+                    self._apply_roi(roi)
+                if self.scheduler is not None:
+                    pipeline.frame_skip = self.scheduler.update(self.tracker.trackers, pipeline.inference_seconds)
+                if self.governor is not None and self.governor.update(pipeline.inference_seconds):
+                    self._switch_detector(pipeline)
 
                 key = cv2.waitKey(1)
                 if key == ord('q') or key == 27:
                     break
         finally:
+            pipeline.stop()
             self.cap.release()
             cv2.destroyAllWindows()
+            if self.log is not None:
+                self.log.close()
             self._print_summary()
+            self._print_pipeline_stats(pipeline)
 
-    def _process_frame(self, frame):
-        results = self.model.predict(frame, imgsz=config['imgsz'], conf=config['confidence_threshold'])[0]
+    def _switch_light_mode(self, pipeline):
+        self.light.apply(self.detectors, self.tracker, pipeline)
+        print(f"[INFO] Light mode: {self.light.mode} (brightness {self.light.brightness:.1f})")
+        if config['logging_enabled']:
+            self._log_event(f"LIGHT_MODE, {self.light.label}, brightness:{self.light.brightness:.1f}")
 
-        detections = []
-        class_map = {}
+    def _apply_roi(self, roi):
+        """Move the ROI onto the current view after the alignment check saved (or removed) its correction."""
+        for detector in self.detectors:
+            detector.roi = roi
+        print(f"[INFO] ROI reprojected for camera drift: {roi.polygon.tolist()}")
+        if config['logging_enabled']:
+            self._log_event("ROI_REPROJECTED")
+
+    def _switch_detector(self, pipeline):
+        level, reason = self.governor.level, self.governor.reason
+        if self.variant_imgsz is not None:
+            self.detector.imgsz = self.variant_imgsz[level]
+        else:
+            self.detector = self.detectors[level]
+            pipeline.detector = self.detector
+        pipeline.inference_seconds = 0.0
+        variant = f"imgsz:{self.detector.imgsz}, threads:{self.detector.num_threads}"
+        print(f"[INFO] Governor switched to variant {level} ({variant}): {reason}")
+        if config['logging_enabled']:
+            self._log_event(f"GOVERNOR, variant:{level}, {variant}, reason:{reason}")
 
-        for box in results.boxes:
-            cls_id = int(box.cls.item())
-            conf = box.conf.item()
-            if cls_id in CLASSES:
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                detections.append([x1, y1, x2, y2, conf])
-                class_map[(x1, y1, x2, y2)] = CLASSES[cls_id]
+    def _process_frame(self, frame, detections, dt):
+        # Update the tracker even on empty frames so lost tracks age out and are retired
+        tracked = self.tracker.update(detections, dt=dt)
 
-        if len(detections) == 0:
-            self._annotate_frame(frame)
-            cv2.imshow('Modal Share Counting (Edge Mode)', frame)
-            return
+        self.state.retire(self.tracker.removed_ids)
 
-        detections_np = np.array(detections)
-        tracked = self.tracker.update(detections_np)
-
-        for x1, y1, x2, y2, obj_id in tracked:
-            bbox = (x1, y1, x2, y2)
-            class_label = self._get_class_label(bbox, class_map)
-            if class_label:
-                if obj_id not in self.class_id_mapping[class_label]:
-                    self.class_id_mapping[class_label][obj_id] = self.class_id_counters[class_label]
-                    self.class_id_counters[class_label] += 1
-                if obj_id not in self.seen_ids[class_label]:
-                    self.seen_ids[class_label].add(obj_id)
-                    self.counts[class_label] += 1
-                if config['draw_bbox']:
-                    display_id = self.class_id_mapping[class_label][obj_id]
-                    self._draw_bbox(frame, bbox, class_label, display_id)
+        for bbox, class_label, display_id in self.state.observe(tracked):
+            if config['draw_bbox']:
+                self._draw_bbox(frame, bbox, class_label, display_id)
 
         self._annotate_frame(frame)
         cv2.imshow('Modal Share Counting (Edge Mode)', frame)
@@ -109,11 +206,15 @@ class ModalShareCounter:
         cv2.putText(frame, text, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
 
     def _annotate_frame(self, frame):
-        for idx, (cls, count) in enumerate(self.counts.items()):
+        for idx, (cls, count) in enumerate(self.state.counts.items()):
             text = f'{cls}: {count}'
             position = (10, 30 + 20 * idx)
             cv2.putText(frame, text, position, cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
+    def _log_event(self, event):
+        now = datetime.now()
+        self.log.write(now, f"{now.strftime('%Y-%m-%d %H:%M:%S')}, {event}")
+
     def _log_counts(self):
         now = datetime.now()
         current_interval = now.minute // config['log_interval_minutes']
@@ -122,24 +223,30 @@ class ModalShareCounter:
 
         self.last_log_minute = current_interval
 
-        log_dir = 'data'
-        os.makedirs(log_dir, exist_ok=True)
-        log_filename = f"{now.strftime('%Y%m%d')}-{config['location']}-{config['camera_id']}.log"
-        log_path = os.path.join(log_dir, log_filename)
-
-        timestamp = now.strftime("%Y-%m-%d %H:%M")
-        counts_str = ", ".join([f"{cls}:{self.counts[cls]}" for cls in CLASSES.values()])
-        log_line = f"{timestamp}, {counts_str}\n"
-
-        with open(log_path, 'a') as f:
-            f.write(log_line)
+        self.log.counts(now, self.light.label, self.state.counts)
+        skip_stats = self.scheduler.pop_stats() if self.scheduler is not None else None
+        if skip_stats:
+            self._log_event(f"FRAME_SKIP, mean:{skip_stats['mean']:.1f}, min:{skip_stats['min']}, "
+                            f"max:{skip_stats['max']}, inferences:{skip_stats['inferences']}")
 
     def _print_summary(self):
         print('Final Modal Share Counts:')
-        for cls, count in self.counts.items():
+        for cls, count in self.state.counts.items():
             print(f'{cls}: {count}')
 
+    def _print_pipeline_stats(self, pipeline):
+        print('Pipeline queues:')
+        for stage, stats in pipeline.stats().items():
+            print(f"{stage}: max depth {stats['max_depth']}, mean depth {stats['mean_depth']:.2f}, "
+                  f"dropped {stats['dropped']} of {stats['puts']}")
+        print(f'motion gate: skipped inference on {pipeline.gated_frames} frames')
+        if self.motion_sleep is not None:
+            print(f'motion sleep: asleep {self.motion_sleep.asleep_seconds:.0f}s, '
+                  f'woken {self.motion_sleep.wakeups} times')
+
 
 if __name__ == '__main__':
+    # The supervisor stops the counter with SIGTERM; exit through run()'s cleanup so buffered logs are written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     counter = ModalShareCounter()
     counter.run()
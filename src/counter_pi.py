@@ -1,31 +1,71 @@
 import os
+import sys
+import signal
 import cv2
-import numpy as np
 from datetime import datetime
-from ultralytics import YOLO
 from sort import Sort
+from pipeline import Pipeline
+from motion import MotionGate, MotionSleep
+from scheduler import FrameSkipScheduler
+from governor import ResolutionGovernor
+from lightmode import LightModeSwitcher, LuminanceEstimator
+from detectors import detector_from_config, variant_config
+from roi import AlignmentWatcher
+from camera_broker import SharedCamera
+from supervisor import Heartbeat
+from counting import CountingState
+from logsink import LogSink
 from config import (
     LOCATION,
     CAMERA_ID,
+    ROI,
+    CAMERA_ALIGNMENT_FILE,
     LOGGING_ENABLED,
     LOG_INTERVAL_MINUTES,
+    LOG_FORMAT,
+    LOG_FLUSH_SECONDS,
+    LOG_FSYNC,
     FRAME_WIDTH,
     FRAME_HEIGHT,
     CAMERA_INDEX,
     FRAME_SKIP,
     CONFIDENCE_THRESHOLD,
+    TRACK_LOW_THRESHOLD,
     DRAW_BBOX,
+    NCNN_THREADS,
+    PIPELINE_DEPTH,
+    PIPELINE_POLICY,
+    MOTION_GATE,
+    MOTION_MIN_FRACTION,
+    MOTION_SLEEP,
+    SLEEP_AFTER_SECONDS,
+    SLEEP_FPS,
+    ADAPTIVE_SKIP,
+    MIN_FRAME_SKIP,
+    MAX_FRAME_SKIP,
+    CPU_BUDGET,
+    CAMERA_FPS,
+    GOVERNOR,
+    GOVERNOR_TEMP_PATH,
+    GOVERNOR_HOT_TEMP,
+    GOVERNOR_COOL_TEMP,
+    GOVERNOR_LATENCY_MS,
+    GOVERNOR_DWELL_SECONDS,
+    MODEL_VARIANTS,
+    LOW_LIGHT_THRESHOLD,
+    LOW_LIGHT_EXIT_THRESHOLD,
+    LIGHT_SMOOTHING_SECONDS,
+    LIGHT_MIN_DWELL_MINUTES,
+    LOW_LIGHT_PREPROCESS,
+    LOW_LIGHT_CONFIDENCE_THRESHOLD,
+    LOW_LIGHT_TRACK_LOW_THRESHOLD,
+    CAMERA_BROKER,
+    CAMERA_SHM_NAME,
+    HEARTBEAT_SECONDS,
 )
 
-# Classes
-CLASSES = {
-    0: 'person',
-    1: 'bicycle',
-    2: 'car',
-    3: 'motorcycle',
-    5: 'bus',
-    7: 'truck',
-}
+# Classes to count, matched by name against the model's metadata (ids differ in pruned exports)
+CLASSES = ['person', 'bicycle', 'car', 'motorcycle', 'bus', 'truck']
 
 # Model path (relative to src/)
 MODEL_FOLDER = os.path.join(os.path.dirname(__file__), "..", "models", "yolo11n_ncnn_model")
@@ -33,20 +73,90 @@ MODEL_FOLDER = os.path.join(os.path.dirname(__file__), "..", "models", "yolo11n_
 # Automatic HEADLESS mode detection
 HEADLESS = not os.environ.get("DISPLAY")
 
+# How often to look for a drift correction saved by the alignment check
+ALIGNMENT_CHECK_SECONDS = 60
+
+# The detector settings in config.yaml's schema, so the detector, its ROI crop and the drift
+# correction are built by the same code as in counter.py
+DETECTOR_CONFIG = {
+    'detector': 'ncnn',
+    'ncnn_model': MODEL_FOLDER,
+    'detector_fallback': None,
+    'imgsz': 640,
+    'num_threads': NCNN_THREADS,
+    'track_low_threshold': TRACK_LOW_THRESHOLD,
+    'frame_width': FRAME_WIDTH,
+    'frame_height': FRAME_HEIGHT,
+    'camera_id': CAMERA_ID,
+    'roi': ROI,
+    'alignment_file': CAMERA_ALIGNMENT_FILE,
+}
+
 
 class ModalShareCounter:
     def __init__(self):
-        self.model = YOLO(MODEL_FOLDER)
-        self.tracker = Sort()
+        # NCNN exports have a fixed input size, so each variant names its own exported folder
+        # (same schema as model_variants in config.yaml). All are loaded up front so a
+        # governor switch is instant.
+        variants = MODEL_VARIANTS if GOVERNOR else [{'imgsz': 640, 'model': MODEL_FOLDER}]
+        self.models = [detector_from_config(variant_config(DETECTOR_CONFIG, variant), CLASSES)
+                       for variant in variants]
+        self.model = self.models[0]
+        self.governor = None
+        if GOVERNOR:
+            self.governor = ResolutionGovernor(
+                variants,
+                latency_budget=GOVERNOR_LATENCY_MS / 1000,
+                temp_path=GOVERNOR_TEMP_PATH,
+                hot_temp=GOVERNOR_HOT_TEMP,
+                cool_temp=GOVERNOR_COOL_TEMP,
+                dwell_seconds=GOVERNOR_DWELL_SECONDS,
+            )
+        self.tracker = Sort(high_threshold=CONFIDENCE_THRESHOLD, low_threshold=TRACK_LOW_THRESHOLD)
+        # Day and night run in this one process: switching keeps the model, tracks and counts
+        self.light = LightModeSwitcher(
+            {
+                'normal': {
+                    'preprocess': 'none',
+                    'confidence_threshold': CONFIDENCE_THRESHOLD,
+                    'track_low_threshold': TRACK_LOW_THRESHOLD,
+                },
+                'low_light': {
+                    'preprocess': LOW_LIGHT_PREPROCESS,
+                    'confidence_threshold': LOW_LIGHT_CONFIDENCE_THRESHOLD,
+                    'track_low_threshold': LOW_LIGHT_TRACK_LOW_THRESHOLD,
+                },
+            },
+            enter_threshold=LOW_LIGHT_THRESHOLD,
+            exit_threshold=LOW_LIGHT_EXIT_THRESHOLD,
+            dwell_seconds=LIGHT_MIN_DWELL_MINUTES * 60,
+        )
         self.cap = self._init_camera()
+        self.motion_gate = MotionGate(min_fraction=MOTION_MIN_FRACTION) if MOTION_GATE else None
+        self.motion_sleep = MotionSleep(SLEEP_AFTER_SECONDS, SLEEP_FPS) if MOTION_GATE and MOTION_SLEEP else None
+        self.scheduler = None
+        if ADAPTIVE_SKIP:
+            self.scheduler = FrameSkipScheduler(
+                fps=self.cap.get(cv2.CAP_PROP_FPS) or CAMERA_FPS,
+                min_skip=MIN_FRAME_SKIP,
+                max_skip=MAX_FRAME_SKIP,
+                cpu_budget=CPU_BUDGET,
+            )
+        self.heartbeat = Heartbeat(HEARTBEAT_SECONDS)
         self.frame_count = 0
-        self.seen_ids = {cls: set() for cls in CLASSES.values()}
-        self.counts = {cls: 0 for cls in CLASSES.values()}
-        self.class_id_mapping = {cls: {} for cls in CLASSES.values()}
-        self.class_id_counters = {cls: 1 for cls in CLASSES.values()}
+        self.state = CountingState(self.model.classes)
         self.last_log_minute = None
+        # Log lines are buffered and written in batches to spare the SD card
+        self.log = None
+        if LOGGING_ENABLED:
+            self.log = LogSink('data', LOCATION, CAMERA_ID, log_format=LOG_FORMAT,
+                               flush_seconds=LOG_FLUSH_SECONDS, fsync=LOG_FSYNC)
+        self.alignment = AlignmentWatcher(DETECTOR_CONFIG, ALIGNMENT_CHECK_SECONDS)
 
     def _init_camera(self):
+        if CAMERA_BROKER:
+            # The broker process owns the device; read its frames from shared memory
+            return SharedCamera(CAMERA_SHM_NAME)
         # cap = cv2.VideoCapture(CAMERA_INDEX)
         # cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
         # cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
@@ -54,63 +164,81 @@ class ModalShareCounter:
         cap = cv2.VideoCapture(video_path)
         return cap
 
-    def _get_class_label(self, bbox, class_map):
-        return class_map.get(
-            min(class_map.keys(), key=lambda b: np.linalg.norm(np.array(b) - np.array(bbox))),
-            None
-        )
-
     def run(self):
+        pipeline = Pipeline(
+            self.cap,
+            self.model,
+            frame_skip=FRAME_SKIP,
+            depth=PIPELINE_DEPTH,
+            policy=PIPELINE_POLICY,
+            gate=self.motion_gate,
+            sleep=self.motion_sleep,
+            tracks_alive=lambda: len(self.tracker.trackers) > 0,
+            luminance=LuminanceEstimator(time_constant=LIGHT_SMOOTHING_SECONDS),
+        )
+        pipeline.start()
+        last_index = None
         try:
-            while True:
-                ret, frame = self.cap.read()
-                if not ret:
-                    break
-
-                if self.frame_count % FRAME_SKIP == 0:
-                    self._process_frame(frame)
-
-                self.frame_count += 1
+            for index, frame, detections in pipeline:
+                # Frames dropped under load widen the gap; the tracker predicts across it
+                dt = FRAME_SKIP if last_index is None else index - last_index
+                last_index = index
+                self.frame_count = index + 1
+                if self.light.update(pipeline.luminance.value):
+                    self._switch_light_mode(pipeline)
+                self._process_frame(frame, detections, dt)
+                self.heartbeat.beat(f"frame {index}")
+                if (roi := self.alignment.poll()) is not None:
+                    self._apply_roi(roi)
+                if self.scheduler is not None:
+                    pipeline.frame_skip = self.scheduler.update(self.tracker.trackers, pipeline.inference_seconds)
+                if self.governor is not None and self.governor.update(pipeline.inference_seconds):
+                    self._switch_detector(pipeline)
 
                 key = cv2.waitKey(1)
                 if key == ord('q') or key == 27:
                     break
         finally:
+            pipeline.stop()
             self.cap.release()
             cv2.destroyAllWindows()
+            if self.log is not None:
+                self.log.close()
             self._print_summary()
+            self._print_pipeline_stats(pipeline)
 
-    def _process_frame(self, frame):
-        results = self.model.predict(frame)[0]
-        detections = []
-        class_map = {}
-
-        for box in results.boxes:
-            cls_id = int(box.cls.item())
-            conf = box.conf.item()
-            if conf < CONFIDENCE_THRESHOLD:
-                continue
-            if cls_id in CLASSES:
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                detections.append([x1, y1, x2, y2, conf])
-                class_map[(x1, y1, x2, y2)] = CLASSES[cls_id]
-
-        detections_np = np.array(detections)
-        tracked = self.tracker.update(detections_np)
-
-        for x1, y1, x2, y2, obj_id in tracked:
-            bbox = (x1, y1, x2, y2)
-            class_label = self._get_class_label(bbox, class_map)
-            if class_label:
-                if obj_id not in self.class_id_mapping[class_label]:
-                    self.class_id_mapping[class_label][obj_id] = self.class_id_counters[class_label]
-                    self.class_id_counters[class_label] += 1
-                if obj_id not in self.seen_ids[class_label]:
-                    self.seen_ids[class_label].add(obj_id)
-                    self.counts[class_label] += 1
-                if DRAW_BBOX:
-                    display_id = self.class_id_mapping[class_label][obj_id]
-                    self._draw_bbox(frame, bbox, class_label, display_id)
+    def _switch_light_mode(self, pipeline):
+        self.light.apply(self.models, self.tracker, pipeline)
+        print(f"[INFO] Light mode: {self.light.mode} (brightness {self.light.brightness:.1f})")
+        if LOGGING_ENABLED:
+            self._log_event(f"LIGHT_MODE, {self.light.label}, brightness:{self.light.brightness:.1f}")
+
+    def _apply_roi(self, roi):
+        """Move the ROI onto the current view after the alignment check saved (or removed) its correction."""
+        for model in self.models:
+            model.roi = roi
+        print(f"[INFO] ROI reprojected for camera drift: {roi.polygon.tolist()}")
+        if LOGGING_ENABLED:
+            self._log_event("ROI_REPROJECTED")
+
+    def _switch_detector(self, pipeline):
+        level, reason = self.governor.level, self.governor.reason
+        self.model = self.models[level]
+        pipeline.detector = self.model
+        pipeline.inference_seconds = 0.0
+        variant = f"imgsz:{self.model.imgsz}, threads:{self.model.num_threads}"
+        print(f"[INFO] Governor switched to variant {level} ({variant}): {reason}")
+        if LOGGING_ENABLED:
+            self._log_event(f"GOVERNOR, variant:{level}, {variant}, reason:{reason}")
+
+    def _process_frame(self, frame, detections, dt):
+        tracked = self.tracker.update(detections, dt=dt)
+
+        self.state.retire(self.tracker.removed_ids)
+
+        for bbox, class_label, display_id in self.state.observe(tracked):
+            if DRAW_BBOX:
+                self._draw_bbox(frame, bbox, class_label, display_id)
 
         self._annotate_frame(frame)
 
@@ -128,11 +256,15 @@ class ModalShareCounter:
         cv2.putText(frame, text, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
 
     def _annotate_frame(self, frame):
-        for idx, (cls, count) in enumerate(self.counts.items()):
+        for idx, (cls, count) in enumerate(self.state.counts.items()):
             text = f'{cls}: {count}'
             position = (10, 30 + 20 * idx)
             cv2.putText(frame, text, position, cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
+    def _log_event(self, event):
+        now = datetime.now()
+        self.log.write(now, f"{now.strftime('%Y-%m-%d %H:%M:%S')}, {event}")
+
     def _log_counts(self):
         now = datetime.now()
         current_interval = now.minute // LOG_INTERVAL_MINUTES
@@ -141,25 +273,30 @@ class ModalShareCounter:
 
         self.last_log_minute = current_interval
 
-        log_dir = 'data'
-        os.makedirs(log_dir, exist_ok=True)
-        log_filename = f"{now.strftime('%Y%m%d')}-{LOCATION}-{CAMERA_ID}.log"
-        log_path = os.path.join(log_dir, log_filename)
-
-        light_status = "NORMAL_LIGHT"
-        timestamp = now.strftime("%Y-%m-%d %H:%M")
-        counts_str = ", ".join([f"{cls}:{self.counts[cls]}" for cls in CLASSES.values()])
-        log_line = f"{timestamp}, {light_status}, {counts_str}\n"
-
-        with open(log_path, 'a') as f:
-            f.write(log_line)
+        self.log.counts(now, self.light.label, self.state.counts)
+        skip_stats = self.scheduler.pop_stats() if self.scheduler is not None else None
+        if skip_stats:
+            self._log_event(f"FRAME_SKIP, mean:{skip_stats['mean']:.1f}, min:{skip_stats['min']}, "
+                            f"max:{skip_stats['max']}, inferences:{skip_stats['inferences']}")
 
     def _print_summary(self):
         print('Final Modal Share Counts:')
-        for cls, count in self.counts.items():
+        for cls, count in self.state.counts.items():
             print(f'{cls}: {count}')
 
+    def _print_pipeline_stats(self, pipeline):
+        print('Pipeline queues:')
+        for stage, stats in pipeline.stats().items():
+            print(f"{stage}: max depth {stats['max_depth']}, mean depth {stats['mean_depth']:.2f}, "
+                  f"dropped {stats['dropped']} of {stats['puts']}")
+        print(f'motion gate: skipped inference on {pipeline.gated_frames} frames')
+        if self.motion_sleep is not None:
+            print(f'motion sleep: asleep {self.motion_sleep.asleep_seconds:.0f}s, '
+                  f'woken {self.motion_sleep.wakeups} times')
+
 
 if __name__ == '__main__':
+    # The supervisor stops the counter with SIGTERM; exit through run()'s cleanup so buffered logs are written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     counter = ModalShareCounter()
     counter.run()
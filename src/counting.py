@@ -0,0 +1,59 @@
+# counting.py - Per-class counts of tracked objects with bounded memory
+# Only tracks that the tracker still holds are remembered; counts are fixed-size.
+
+import sys
+import numpy as np
+
+
+class CountingState:
+    """Counts each track once, under its class, and forgets it when the tracker deletes it.
+
+    A track's class is its confidence-weighted vote (see KalmanBoxBank), which can change
+    while the track lives; its count then moves to the new class, so each track ends up
+    counted under the class it was finally voted. Track ids from Sort are never reused, so a
+    retired id cannot be counted twice and memory stays proportional to the number of live
+    tracks rather than to uptime.
+    """
+
+    def __init__(self, classes):
+        self.labels = list(classes.values())
+        self.class_index = {int(cls_id): i for i, cls_id in enumerate(classes)}
+        self.totals = np.zeros(len(self.labels), dtype=np.int64)
+        self.next_display_id = np.ones(len(self.labels), dtype=np.int64)
+        self.live = {}  # track id -> (class index, per-class display id)
+
+    @property
+    def counts(self):
+        return dict(zip(self.labels, self.totals.tolist()))
+
+    def observe(self, tracked):
+        """Count new tracks and return (bbox, label, display_id) for each tracked object."""
+        seen = []
+        for x1, y1, x2, y2, obj_id, cls_id, _ in tracked:
+            obj_id = int(obj_id)
+            entry = self.live.get(obj_id)
+            idx = self.class_index.get(int(cls_id))
+            if idx is None:
+                # Not a counted class; a counted track keeps its last counted class
+                if entry is None:
+                    continue
+            elif entry is None or entry[0] != idx:
+                if entry is not None:
+                    # The vote changed the track's class: move its count over
+                    self.totals[entry[0]] -= 1
+                entry = (idx, int(self.next_display_id[idx]))
+                self.next_display_id[idx] += 1
+                self.totals[idx] += 1
+                self.live[obj_id] = entry
+            seen.append(((x1, y1, x2, y2), self.labels[entry[0]], entry[1]))
+        return seen
+
+    def retire(self, ids):
+        """Forget tracks the tracker has deleted."""
+        for obj_id in ids:
+            self.live.pop(int(obj_id), None)
+
+    @property
+    def nbytes(self):
+        return (self.totals.nbytes + self.next_display_id.nbytes + sys.getsizeof(self.live)
+                + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in self.live.items()))
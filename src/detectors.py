@@ -0,0 +1,341 @@
+# detectors.py - YOLO11 detectors that return plain NumPy arrays
+# Every detector maps a BGR frame to an N x 6 array of [x1, y1, x2, y2, conf, cls].
+
+import os
+import ast
+import time
+from abc import ABC, abstractmethod
+import cv2
+import yaml
+import numpy as np
+from roi import RegionOfInterest, RoiDetector
+
+
+def read_metadata(model_dir: str) -> dict:
+    """Read the Ultralytics export metadata.yaml next to an exported model."""
+    with open(os.path.join(model_dir, "metadata.yaml"), "r") as f:
+        return yaml.safe_load(f)
+
+
+class Letterbox:
+    """Resize-and-pad to a square network input, reusing the same buffers every frame."""
+
+    def __init__(self, size: int, fill: int = 114):
+        self.size = size
+        self.fill = fill
+        self.canvas = np.full((size, size, 3), fill, dtype=np.uint8)
+        self._frame_shape = None
+        self._resized = None
+
+    def _fit(self, frame_shape: tuple) -> None:
+        h, w = frame_shape[:2]
+        self.scale = min(self.size / h, self.size / w)
+        nw, nh = round(w * self.scale), round(h * self.scale)
+        self.left = (self.size - nw) // 2
+        self.top = (self.size - nh) // 2
+        self.canvas[:] = self.fill
+        self._resized = np.empty((nh, nw, 3), dtype=np.uint8)
+        self._frame_shape = frame_shape
+
+    def __call__(self, frame: np.ndarray) -> np.ndarray:
+        if frame.shape != self._frame_shape:
+            self._fit(frame.shape)
+        nh, nw = self._resized.shape[:2]
+        cv2.resize(frame, (nw, nh), dst=self._resized, interpolation=cv2.INTER_LINEAR)
+        self.canvas[self.top:self.top + nh, self.left:self.left + nw] = self._resized
+        return self.canvas
+
+    def unmap(self, boxes: np.ndarray) -> np.ndarray:
+        """Map xyxy boxes from network input coordinates back to the original frame."""
+        boxes -= (self.left, self.top, self.left, self.top)
+        boxes /= self.scale
+        return boxes
+
+
+def decode_yolo(output: np.ndarray, class_ids: np.ndarray, conf_threshold: float,
+                iou_threshold: float) -> np.ndarray:
+    """Decode a raw YOLO11 head output of shape (4 + num_classes, anchors).
+
+    Only the score rows of class_ids are looked at, so anchors whose best counted class
+    is under the threshold are dropped before NMS. Boxes stay in network input pixels.
+    """
+    scores = output[4 + class_ids]
+    best = scores.argmax(axis=0)
+    conf = np.take_along_axis(scores, best[None], axis=0)[0]
+    keep = np.flatnonzero(conf >= conf_threshold)
+    if len(keep) == 0:
+        return np.empty((0, 6), dtype=np.float32)
+
+    cx, cy, w, h = output[:4, keep]
+    dets = np.stack((cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2,
+                     conf[keep], class_ids[best[keep]]), axis=1).astype(np.float32)
+    return nms(dets, iou_threshold)
+
+
+def results_to_detections(result, class_ids, conf_threshold: float = 0.0) -> np.ndarray:
+    """Turn one Ultralytics Results object into an N x 6 [x1, y1, x2, y2, conf, cls] array.
+
+    Boxes are copied off the device once per column and filtered with masks, instead of
+    calling .item() and .tolist() per box.
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.empty((0, 6), dtype=np.float32)
+    dets = np.empty((len(boxes), 6), dtype=np.float32)
+    dets[:, :4] = boxes.xyxy.cpu().numpy()
+    dets[:, 4] = boxes.conf.cpu().numpy()
+    dets[:, 5] = boxes.cls.cpu().numpy()
+    keep = np.isin(dets[:, 5], class_ids) & (dets[:, 4] >= conf_threshold)
+    return dets[keep]
+
+
+def nms(dets: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Class-aware non-maximum suppression on N x 6 [x1, y1, x2, y2, conf, cls] detections."""
+    if len(dets) == 0:
+        return dets
+    xywh = np.column_stack((dets[:, :2], dets[:, 2:4] - dets[:, :2]))
+    idx = cv2.dnn.NMSBoxesBatched(xywh.tolist(), dets[:, 4].tolist(), dets[:, 5].astype(int).tolist(),
+                                  0.0, iou_threshold)
+    return dets[np.asarray(idx, dtype=int).reshape(-1)]
+
+
+class Detector(ABC):
+    """Common interface of all detector backends.
+
+    Constructing a detector is cheap: the engine (and its heavy imports such as torch)
+    is only loaded by load(), so importing this module costs nothing for unused backends.
+
+    classes names the classes to count, as a list or an {id: name} dict. They are matched by
+    name against the model's own class map when it loads, so a pruned export with fewer
+    classes works unchanged; from then on classes is keyed by the model's class ids.
+    iou_threshold is the NMS overlap limit; 0.7 is the Ultralytics default.
+    """
+
+    def __init__(self, model: str, classes: dict, conf_threshold: float = 0.25,
+                 iou_threshold: float = 0.7, num_threads: int = 4, imgsz: int = 640):
+        self.model = model
+        self.classes = classes
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.num_threads = num_threads
+        self.imgsz = imgsz
+
+    @abstractmethod
+    def load(self) -> None:
+        """Load the engine and resolve classes against the model's metadata."""
+
+    def resolve_classes(self, names: dict) -> None:
+        """Key the counted classes by this model's class ids, given its {id: name} metadata."""
+        wanted = list(self.classes.values()) if isinstance(self.classes, dict) else list(self.classes)
+        self.classes = {int(i): name for i, name in names.items() if name in wanted}
+        if not self.classes:
+            raise ValueError(f"{self.model} has none of the classes {wanted}")
+        missing = [name for name in wanted if name not in self.classes.values()]
+        if missing:
+            print(f"[WARNING] {self.model} has no class {missing}; it will not be counted.")
+        self.class_ids = np.array(list(self.classes), dtype=np.int64)
+
+    def warmup(self) -> None:
+        """Run one blank frame so allocations and graph setup happen before the first real frame."""
+        self.detect(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8))
+
+    def detect_batch(self, frames: list) -> list:
+        """Detections for each frame, as N x 6 [x1, y1, x2, y2, conf, cls] float32 arrays."""
+        return [self.detect(frame) for frame in frames]
+
+    @abstractmethod
+    def detect(self, frame: np.ndarray) -> np.ndarray:
+        """Detections for one BGR frame, as an N x 6 [x1, y1, x2, y2, conf, cls] float32 array."""
+
+
+DETECTORS = {}
+
+
+def register_detector(name: str):
+    """Class decorator adding a backend to DETECTORS under the given name."""
+    def wrap(cls):
+        DETECTORS[name] = cls
+        return cls
+    return wrap
+
+
+def create_detector(name: str, model: str, classes: dict, fallback: str | None = None,
+                    fallback_model: str | None = None, **options) -> Detector:
+    """Build, load and warm up a registered backend.
+
+    If the backend's model file or Python package is missing and a fallback is given, the
+    fallback backend is loaded instead so the counter still starts.
+    """
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector '{name}'. Choose from {list(DETECTORS)}")
+
+    start = time.perf_counter()
+    detector = DETECTORS[name](model, classes, **options)
+    try:
+        detector.load()
+    except (FileNotFoundError, ImportError) as e:
+        if fallback is None:
+            raise
+        print(f"[WARNING] Cannot load {name} detector ({e}). Falling back to {fallback}.")
+        return create_detector(fallback, fallback_model, classes, **options)
+    detector.warmup()
+    print(f"[INFO] Loaded {name} detector from {model} in {time.perf_counter() - start:.2f}s")
+    return detector
+
+
+def model_key(name: str) -> str:
+    """config.yaml key holding a backend's model: model for Ultralytics, else <name>_model."""
+    return 'model' if name == 'ultralytics' else f'{name}_model'
+
+
+def variant_config(config: dict, variant: dict) -> dict:
+    """config.yaml with one model_variants entry applied.
+
+    A variant sets imgsz and, optionally, num_threads and model: the path of the export at
+    that size for the configured backend (NCNN and ONNX exports have a fixed input size).
+    """
+    merged = {**config, 'imgsz': variant['imgsz'], 'num_threads': variant.get('num_threads', config['num_threads'])}
+    if 'model' in variant:
+        merged[model_key(config['detector'])] = variant['model']
+    elif config['detector'] != 'ultralytics':
+        raise ValueError(f"model_variants entry {variant} needs a model: the {config['detector']} "
+                         f"export at imgsz {variant['imgsz']}")
+    return merged
+
+
+def inference_imgsz(config: dict) -> int:
+    """imgsz to run at: scaled down to the ROI crop, if there is one, to keep the pixel density."""
+    roi = RegionOfInterest.from_config(config)
+    if roi is None:
+        return config['imgsz']
+    return roi.scaled_imgsz(config['imgsz'], (config['frame_width'], config['frame_height']))
+
+
+def detector_from_config(config: dict, classes: dict) -> Detector:
+    """Create the backend named by config.yaml's detector key, with detector_fallback as backup.
+
+    The model for a backend is read from model_key(name). If the camera has an ROI polygon,
+    the detector only sees its bounding crop, at an imgsz scaled down to keep the full-frame
+    pixel density, and boxes outside it are dropped.
+    """
+    name = config['detector']
+    fallback = config.get('detector_fallback')
+    roi = RegionOfInterest.from_config(config)
+
+    detector = create_detector(
+        name,
+        config[model_key(name)],
+        classes,
+        fallback=fallback,
+        fallback_model=config[model_key(fallback)] if fallback else None,
+        conf_threshold=config['track_low_threshold'],
+        iou_threshold=config.get('iou_threshold', 0.7),
+        num_threads=config['num_threads'],
+        imgsz=inference_imgsz(config),
+    )
+    return detector if roi is None else RoiDetector(detector, roi)
+
+
+@register_detector("ultralytics")
+class UltralyticsDetector(Detector):
+    """Any model Ultralytics can load (.pt, or an exported folder), via YOLO.predict."""
+
+    def load(self) -> None:
+        from ultralytics import YOLO
+
+        # No existence check here: Ultralytics downloads official weights such as yolo11n.pt
+        # itself, and raises FileNotFoundError for any other missing file
+        self.net = YOLO(self.model)
+        self.resolve_classes(self.net.names)
+
+    def detect(self, frame: np.ndarray) -> np.ndarray:
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames: list) -> list:
+        # classes= makes Ultralytics drop the other classes before NMS as well
+        results = self.net.predict(frames, imgsz=self.imgsz, conf=self.conf_threshold, iou=self.iou_threshold,
+                                   classes=self.class_ids.tolist(), verbose=False)
+        return [results_to_detections(result, self.class_ids, self.conf_threshold) for result in results]
+
+
+@register_detector("ncnn")
+class NcnnDetector(Detector):
+    """YOLO11 NCNN export driven directly through ncnn.Net, without Ultralytics or torch."""
+
+    def load(self) -> None:
+        import ncnn
+
+        param_path = os.path.join(self.model, "model.ncnn.param")
+        bin_path = os.path.join(self.model, "model.ncnn.bin")
+        for path in (param_path, bin_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"NCNN model file not found: {path}")
+
+        self._ncnn = ncnn
+        metadata = read_metadata(self.model)
+        self.imgsz = int(metadata["imgsz"][0])
+        self.resolve_classes(metadata["names"])
+        self.letterbox = Letterbox(self.imgsz)
+
+        self.net = ncnn.Net()
+        self.net.opt.num_threads = self.num_threads
+        self.net.opt.use_vulkan_compute = False
+        self.net.load_param(param_path)
+        self.net.load_model(bin_path)
+        self._norm = [1 / 255.0] * 3
+
+    def detect(self, frame: np.ndarray) -> np.ndarray:
+        img = self.letterbox(frame)
+        mat = self._ncnn.Mat.from_pixels(img, self._ncnn.Mat.PixelType.PIXEL_BGR2RGB, self.imgsz, self.imgsz)
+        mat.substract_mean_normalize([], self._norm)
+
+        with self.net.create_extractor() as ex:
+            ex.input("in0", mat)
+            _, out = ex.extract("out0")
+
+        dets = decode_yolo(np.asarray(out), self.class_ids, self.conf_threshold, self.iou_threshold)
+        dets[:, :4] = self.letterbox.unmap(dets[:, :4])
+        return dets
+
+
+@register_detector("onnx")
+class OnnxDetector(Detector):
+    """YOLO11 ONNX export run with ONNX Runtime, reusing preallocated input and output buffers."""
+
+    def load(self) -> None:
+        import onnxruntime as ort
+
+        if not os.path.exists(self.model):
+            raise FileNotFoundError(f"ONNX model not found: {self.model}")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.model, options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        model_output = self.session.get_outputs()[0]
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        names = ast.literal_eval(metadata["names"]) if "names" in metadata else self.classes
+        self.imgsz = int(model_input.shape[2])
+        self.resolve_classes(names)
+        self.letterbox = Letterbox(self.imgsz)
+
+        # Bound once; every frame writes into the same input array and ORT into the same output
+        self._input = np.empty((1, 3, self.imgsz, self.imgsz), dtype=np.float32)
+        self._output = np.empty([int(d) for d in model_output.shape], dtype=np.float32)
+        self._binding = self.session.io_binding()
+        self._binding.bind_ortvalue_input(model_input.name, ort.OrtValue.ortvalue_from_numpy(self._input))
+        self._binding.bind_ortvalue_output(model_output.name, ort.OrtValue.ortvalue_from_numpy(self._output))
+
+    def detect(self, frame: np.ndarray) -> np.ndarray:
+        img = self.letterbox(frame)
+        # BGR HWC uint8 -> RGB CHW float in [0, 1], written in place
+        np.multiply(img[:, :, ::-1].transpose(2, 0, 1), 1 / 255.0, out=self._input[0], casting="unsafe")
+        self.session.run_with_iobinding(self._binding)
+
+        dets = decode_yolo(self._output[0], self.class_ids, self.conf_threshold, self.iou_threshold)
+        dets[:, :4] = self.letterbox.unmap(dets[:, :4])
+        return dets
@@ -3,15 +3,22 @@ import cv2
 import numpy as np
 import logging
 from datetime import datetime
-from skimage.metrics import structural_similarity as ssim
 from src.motion_detector import detect_motion
+from src.camera_broker import open_camera
+from src.alignment import Alignment, estimate_alignment, load_alignment, save_alignment
+from src.logsink import LogSink
 from src.config import (
     CAMERA_ID,
     LOCATION,
-    CAMERA_CHECK_SIMILARITY_THRESHOLD,
+    CAMERA_ALIGNMENT_TOLERANCE_PX,
+    CAMERA_MAX_CORRECTION_PX,
+    CAMERA_ALIGNMENT_MIN_INLIER_RATIO,
+    CAMERA_ALIGNMENT_MIN_PHASE_RESPONSE,
+    CAMERA_ALIGNMENT_FILE,
     FRAME_WIDTH,
     FRAME_HEIGHT,
     CAMERA_REFERENCE_IMAGE,
+    CAMERA_SHM_NAME,
 )
 
 # Setup log directory
@@ -31,42 +38,60 @@ logging.basicConfig(
 
 
 def capture_frame() -> np.ndarray | None:
-    """Capture a single frame from the camera."""
-    cap = cv2.VideoCapture(0)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
+    """Capture a single frame from the camera broker, or the camera if no broker is running."""
+    cap = open_camera(CAMERA_SHM_NAME, 0, FRAME_WIDTH, FRAME_HEIGHT)
     ret, frame = cap.read()
     cap.release()
     return frame if ret else None
 
 
-def compute_similarity(img1: np.ndarray, img2: np.ndarray) -> float:
-    """Compute SSIM similarity score between two images."""
-    gray_a = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-    gray_b = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
-    score, _ = ssim(gray_a, gray_b, full=True)
-    return score
+# The two estimators report confidence on different scales: the ORB fit's inlier share, and
+# the phase-correlation peak, which stays near 0.05 for unrelated views
+MIN_CONFIDENCE = {
+    "orb": CAMERA_ALIGNMENT_MIN_INLIER_RATIO,
+    "phase": CAMERA_ALIGNMENT_MIN_PHASE_RESPONSE,
+}
 
 
-def log_alignment(status: bool, score: float) -> None:
-    """Log camera alignment status and similarity score."""
-    now = datetime.now().strftime("%Y-%m-%d %H:%M")
-    status_str = "OK" if status else "MOVED"
-    message = "" if status else ", MISALIGNED_CAMERA"
-    log_line = f"{now}, CAMERA_ALIGNMENT, status:{status_str}, similarity:{score:.3f}{message}"
+def correction_changed(alignment: Alignment, frame_size: tuple) -> bool:
+    """Whether alignment moves the ROI noticeably away from the correction saved last time."""
+    saved = load_alignment(CAMERA_ALIGNMENT_FILE)
+    return saved is None or alignment.drift(frame_size, saved) > CAMERA_ALIGNMENT_TOLERANCE_PX
 
-    log_filename = f"{datetime.now().strftime('%Y%m%d')}-{LOCATION}-{CAMERA_ID}.log"
-    log_path = os.path.join(LOG_DIR, log_filename)
-    with open(log_path, "a") as f:
-        f.write(log_line + "\n")
+
+def clear_correction() -> None:
+    """Remove the saved correction, so the counter goes back to its configured ROI."""
+    try:
+        os.remove(CAMERA_ALIGNMENT_FILE)
+        logger.warning("Camera view could not be matched to the reference; ROI correction removed.")
+    except FileNotFoundError:
+        pass
+
+
+def log_alignment(status: str, alignment: Alignment) -> None:
+    """Log camera alignment status and the estimated drift from the reference view."""
+    now = datetime.now()
+    # Only a confident large drift raises the alarm; UNKNOWN means the check could not tell
+    message = ", MISALIGNED_CAMERA" if status == "MOVED" else ""
+    log_line = (f"{now.strftime('%Y-%m-%d %H:%M')}, CAMERA_ALIGNMENT, status:{status}, dx:{alignment.dx:.1f}, dy:{alignment.dy:.1f}, "
+                f"rotation:{alignment.rotation:.2f}, scale:{alignment.scale:.3f}, "
+                f"confidence:{alignment.confidence:.2f}, method:{alignment.method}{message}")
+
+    # Into the counter's daily log: the sink appends it in one write, so it never splits
+    # a line the counter is writing at the same moment
+    log_sink = LogSink(LOG_DIR, LOCATION, CAMERA_ID)
+    try:
+        log_sink.write(now, log_line)
+    finally:
+        log_sink.close()
 
     logger.info(log_line)
 
 
 def check_camera_alignment() -> None:
-    """Compare current frame to reference to verify camera alignment."""
+    """Estimate camera drift from the reference view and correct the ROI when it is small."""
     logger.info("Waiting for still scene to check camera alignment...")
-    cap = cv2.VideoCapture(0)
+    cap = open_camera(CAMERA_SHM_NAME, 0, FRAME_WIDTH, FRAME_HEIGHT)
 
     if detect_motion(cap):
         logger.info("Movement detected. Skipping alignment check.")
@@ -84,7 +109,10 @@ def check_camera_alignment() -> None:
     if not os.path.exists(CAMERA_REFERENCE_IMAGE):
         cv2.imwrite(CAMERA_REFERENCE_IMAGE, current_frame)
         logger.info(f"Reference image not found. Saved new reference to {CAMERA_REFERENCE_IMAGE}")
-        log_alignment(True, 1.000)
+        # A correction measured against an older reference no longer applies
+        identity = Alignment(np.eye(2, 3), 1.0, "reference")
+        save_alignment(CAMERA_ALIGNMENT_FILE, identity)
+        log_alignment("OK", identity)
         return
 
     reference = cv2.imread(CAMERA_REFERENCE_IMAGE)
@@ -92,9 +120,22 @@ def check_camera_alignment() -> None:
         logger.error("Could not load reference image.")
         return
 
-    similarity = compute_similarity(reference, current_frame)
-    aligned = similarity >= CAMERA_CHECK_SIMILARITY_THRESHOLD
-    log_alignment(aligned, similarity)
+    alignment = estimate_alignment(reference, current_frame)
+    frame_size = (current_frame.shape[1], current_frame.shape[0])
+    drift = alignment.drift(frame_size)
+
+    if alignment.confidence < MIN_CONFIDENCE[alignment.method]:
+        status = "UNKNOWN"  # too little texture in common with the reference to tell
+        clear_correction()
+    elif drift > CAMERA_MAX_CORRECTION_PX:
+        status = "MOVED"  # too far to correct safely; the view needs checking on site
+        clear_correction()
+    else:
+        status = "OK" if drift <= CAMERA_ALIGNMENT_TOLERANCE_PX else "CORRECTED"
+        # The counter picks up the saved correction and moves its ROI onto the current view
+        if correction_changed(alignment, frame_size):
+            save_alignment(CAMERA_ALIGNMENT_FILE, alignment)
+    log_alignment(status, alignment)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,9 @@
-import os
 import cv2
-import numpy as np
 import datetime
-from ultralytics import YOLO
 from sort import Sort
+from detectors import create_detector
+from counting import CountingState
+from logsink import LogSink
 from src.config import LOCATION, CAMERA_ID, LOGGING_ENABLED, LOG_INTERVAL_MINUTES
 
 
@@ -13,8 +13,8 @@ FRAME_WIDTH = 416
 FRAME_HEIGHT = 416
 FRAME_SKIP = 5
 CONFIDENCE_THRESHOLD = 0.25
+TRACK_LOW_THRESHOLD = 0.1
 LOG_DIR = "data"
-os.makedirs(LOG_DIR, exist_ok=True)
 
 # Classes to track
 CLASSES = {
@@ -29,13 +29,15 @@ CLASSES = {
 
 class LowLightCounter:
     def __init__(self):
-        self.model = YOLO(MODEL_PATH)
-        self.tracker = Sort()
+        self.model = create_detector(
+            "ultralytics", MODEL_PATH, CLASSES, conf_threshold=TRACK_LOW_THRESHOLD, imgsz=320
+        )
+        self.tracker = Sort(high_threshold=CONFIDENCE_THRESHOLD, low_threshold=TRACK_LOW_THRESHOLD)
         self.cap = self._init_camera()
         self.frame_count = 0
-        self.seen_ids = {cls: set() for cls in CLASSES.values()}
-        self.counts = {cls: 0 for cls in CLASSES.values()}
+        self.state = CountingState(self.model.classes)
         self.last_log_time = datetime.datetime.now()
+        self.log = LogSink(LOG_DIR, LOCATION, CAMERA_ID) if LOGGING_ENABLED else None
 
     def _init_camera(self):
         cap = cv2.VideoCapture(0)
@@ -49,12 +51,6 @@ class LowLightCounter:
         enhanced = clahe.apply(gray)
         return cv2.cvtColor(enhanced, cv2.COLOR_GRAY2BGR)
 
-    def _get_class_label(self, bbox, class_map):
-        return class_map.get(
-            min(class_map.keys(), key=lambda b: np.linalg.norm(np.array(b) - np.array(bbox))),
-            None
-        )
-
     def _log_counts(self):
         if not LOGGING_ENABLED:
             return
@@ -63,15 +59,11 @@ class LowLightCounter:
         if (now - self.last_log_time).total_seconds() < LOG_INTERVAL_MINUTES * 60:
             return
 
-        log_filename = f"{now.strftime('%Y%m%d')}-{LOCATION}-{CAMERA_ID}.log"
-        log_path = os.path.join(LOG_DIR, log_filename)
-        count_str = ", ".join(f"{k}:{v}" for k, v in self.counts.items())
-        with open(log_path, "a") as f:
-            f.write(f"{now.strftime('%Y-%m-%d %H:%M')}, LOW_LIGHT, {count_str}\n")
+        self.log.counts(now, "LOW_LIGHT", self.state.counts)
         self.last_log_time = now
 
     def _annotate_frame(self, frame):
-        for idx, (cls, count) in enumerate(self.counts.items()):
+        for idx, (cls, count) in enumerate(self.state.counts.items()):
             text = f"{cls}: {count}"
             position = (10, 30 + 20 * idx)
             cv2.putText(frame, text, position, cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
@@ -85,27 +77,11 @@ class LowLightCounter:
 
                 if self.frame_count % FRAME_SKIP == 0:
                     enhanced_frame = self._enhance_frame(frame)
-                    results = self.model.predict(enhanced_frame, imgsz=320, conf=CONFIDENCE_THRESHOLD)[0]
-
-                    detections = []
-                    class_map = {}
-                    for box in results.boxes:
-                        cls_id = int(box.cls.item())
-                        conf = box.conf.item()
-                        if cls_id in CLASSES:
-                            x1, y1, x2, y2 = box.xyxy[0].tolist()
-                            detections.append([x1, y1, x2, y2, conf])
-                            class_map[(x1, y1, x2, y2)] = CLASSES[cls_id]
-
-                    detections_np = np.array(detections)
-                    tracked = self.tracker.update(detections_np)
-
-                    for x1, y1, x2, y2, obj_id in tracked:
-                        bbox = (x1, y1, x2, y2)
-                        class_label = self._get_class_label(bbox, class_map)
-                        if class_label and obj_id not in self.seen_ids[class_label]:
-                            self.seen_ids[class_label].add(obj_id)
-                            self.counts[class_label] += 1
+                    detections = self.model.detect(enhanced_frame)
+                    tracked = self.tracker.update(detections, dt=FRAME_SKIP)
+
+                    self.state.retire(self.tracker.removed_ids)
+                    self.state.observe(tracked)
 
                     self._annotate_frame(enhanced_frame)
                     cv2.imshow('Low-Light Modal Counting (Edge Mode)', enhanced_frame)
@@ -118,8 +94,10 @@ class LowLightCounter:
         finally:
             self.cap.release()
             cv2.destroyAllWindows()
+            if self.log is not None:
+                self.log.close()
             print('Final Modal Share Counts:')
-            for cls, count in self.counts.items():
+            for cls, count in self.state.counts.items():
                 print(f'{cls}: {count}')
 
 
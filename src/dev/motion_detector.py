@@ -1,45 +1,42 @@
-import cv2
-import numpy as np
 import time
-from src.config import MOTION_CHECK_INTERVAL, MOTION_THRESHOLD, STILL_THRESHOLD
+from src.motion import MotionGate
+from src.config import MOTION_MIN_FRACTION, STILL_THRESHOLD
 
 
 def detect_motion(cap):
     """
     Detect motion in the camera feed.
 
+    Each frame is compared with a running-average background on a small grey copy
+    (see MotionGate), so frames are read at the camera's pace instead of sleeping
+    between full-resolution diffs, and a brief movement is not missed.
+
     Args:
-        cap: OpenCV VideoCapture object.
+        cap: OpenCV VideoCapture object (or the camera broker's SharedCamera).
 
     Returns:
-        True if motion is detected, False otherwise.
+        True as soon as motion is detected, False once the scene has been still
+        for STILL_THRESHOLD seconds.
     """
-    _, prev_frame = cap.read()
-    if not _:
+    ret, frame = cap.read()
+    if not ret:
         print("[WARNING] Failed to read initial frame for motion detection.")
         return False
 
-    prev_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
-    no_motion_seconds = 0
+    gate = MotionGate(min_fraction=MOTION_MIN_FRACTION)
+    gate.update(frame)  # the first frame seeds the background
+    deadline = time.monotonic() + STILL_THRESHOLD
 
-    while True:
-        time.sleep(MOTION_CHECK_INTERVAL)
+    while time.monotonic() < deadline:
         ret, frame = cap.read()
         if not ret:
-            continue
-
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        frame_diff = cv2.absdiff(prev_gray, gray)
-        _, thresh = cv2.threshold(frame_diff, 25, 255, cv2.THRESH_BINARY)
-        motion_score = np.sum(thresh)
+            print("[WARNING] Camera stopped returning frames during motion detection.")
+            return False
 
-        if motion_score > MOTION_THRESHOLD:
-            print("[INFO] Motion detected.")
+        if gate.update(frame):
+            row, col = divmod(int(gate.region_counts.argmax()), gate.grid[0])
+            print(f"[INFO] Motion detected ({gate.fraction:.1%} of pixels, most in region row {row}, col {col}).")
             return True
-        else:
-            no_motion_seconds += MOTION_CHECK_INTERVAL
-            if no_motion_seconds >= STILL_THRESHOLD:
-                print("[INFO] Scene still for {} seconds.".format(STILL_THRESHOLD))
-                return False
 
-        prev_gray = gray.copy()
+    print("[INFO] Scene still for {} seconds.".format(STILL_THRESHOLD))
+    return False
@@ -9,6 +9,7 @@ import numpy as np
 import time
 from ultralytics import YOLO
 from sort import Sort
+from detectors import results_to_detections
 
 model = YOLO('yolov8n.pt')
 
@@ -25,7 +26,7 @@ cap = cv2.VideoCapture(0)
 cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
 cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
 
-tracker = Sort()
+tracker = Sort(high_threshold=0.4)
 seen_ids = {cls: set() for cls in CLASSES.values()}
 counts = {cls: 0 for cls in CLASSES.values()}
 last_positions = {}
@@ -39,28 +40,16 @@ try:
         if not ret:
             break
 
-        results = model.predict(frame, imgsz=640, conf=0.4)[0]
+        results = model.predict(frame, imgsz=640, conf=0.1)[0]
 
-        detections = []
-        class_map = {}
-
-        for box in results.boxes:
-            cls_id = int(box.cls.item())
-            conf = box.conf.item()
-            if cls_id in CLASSES:
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                detections.append([x1, y1, x2, y2, conf])
-                class_map[(x1, y1, x2, y2)] = CLASSES[cls_id]
-
-        detections = np.array(detections)
+        detections = results_to_detections(results, list(CLASSES))
         tracked = tracker.update(detections)
 
         for obj in tracked:
-            x1, y1, x2, y2, obj_id = obj
+            x1, y1, x2, y2, obj_id, cls_id, _ = obj
             cx = (x1 + x2) / 2
             cy = (y1 + y2) / 2
-            bbox = (x1, y1, x2, y2)
-            class_label = class_map.get(min(class_map.keys(), key=lambda b: np.linalg.norm(np.array(b) - np.array(bbox))), None)
+            class_label = CLASSES.get(int(cls_id))
 
             if class_label:
                 # Count unique objects
@@ -0,0 +1,90 @@
+# governor.py - Thermal- and load-aware choice of model variant
+# A Pi in a sealed enclosure throttles when hot; stepping down to a smaller inference size
+# (or fewer threads) keeps the counter real time, and it steps back up once it has cooled.
+
+import time
+
+DEFAULT_TEMP_PATH = "/sys/class/thermal/thermal_zone0/temp"
+
+
+class ResolutionGovernor:
+    """Picks a level in a list of model variants, ordered heaviest (level 0) to lightest.
+
+    Steps down one level when the SoC is at or above hot_temp, or the mean inference time
+    exceeds latency_budget. Steps up one level when the SoC is below cool_temp and the
+    lighter variant's latency leaves room for the heavier one (latency scales with the
+    number of input pixels). After a switch it holds for dwell_seconds so the latency
+    average reflects the new variant before deciding again.
+
+    The temperature is read from temp_path in millidegrees (the sysfs thermal zone format),
+    at most every check_seconds. Any file in that format can stand in for the sensor.
+    """
+
+    def __init__(self, variants: list, latency_budget: float, temp_path: str = DEFAULT_TEMP_PATH,
+                 hot_temp: float = 75.0, cool_temp: float = 65.0, dwell_seconds: float = 60.0,
+                 check_seconds: float = 5.0, headroom: float = 0.8):
+        if not variants:
+            raise ValueError("ResolutionGovernor needs at least one model variant")
+        if cool_temp >= hot_temp:
+            raise ValueError(f"cool_temp ({cool_temp}) must be below hot_temp ({hot_temp})")
+        self.variants = variants
+        self.latency_budget = latency_budget
+        self.temp_path = temp_path
+        self.hot_temp = hot_temp
+        self.cool_temp = cool_temp
+        self.dwell_seconds = dwell_seconds
+        self.check_seconds = check_seconds
+        self.headroom = headroom
+        self.level = 0
+        self.temperature = None
+        self.reason = None
+        self._last_switch = time.monotonic()
+        self._last_check = None
+
+    @property
+    def variant(self) -> dict:
+        return self.variants[self.level]
+
+    def read_temperature(self) -> float | None:
+        """SoC temperature in degrees Celsius, or None if the sensor cannot be read."""
+        try:
+            with open(self.temp_path) as f:
+                return int(f.read().strip()) / 1000.0
+        except (OSError, ValueError):
+            return None
+
+    def _upscale_cost(self) -> float:
+        """Expected latency ratio of the next heavier variant to the current one."""
+        current, heavier = self.variant['imgsz'], self.variants[self.level - 1]['imgsz']
+        return (heavier / current) ** 2
+
+    def update(self, inference_seconds: float, now: float | None = None) -> bool:
+        """Re-evaluate the level; True if it changed (see level, variant and reason)."""
+        now = time.monotonic() if now is None else now
+        if self._last_check is not None and now - self._last_check < self.check_seconds:
+            return False
+        self._last_check = now
+        self.temperature = self.read_temperature()
+        if now - self._last_switch < self.dwell_seconds:
+            return False
+
+        temp = self.temperature
+        latency_ms = inference_seconds * 1000
+        budget_ms = self.latency_budget * 1000
+        if self.level < len(self.variants) - 1:
+            if temp is not None and temp >= self.hot_temp:
+                return self._switch(self.level + 1, f"temp {temp:.1f}C >= {self.hot_temp:.0f}C", now)
+            if inference_seconds > self.latency_budget:
+                return self._switch(self.level + 1, f"latency {latency_ms:.0f}ms > {budget_ms:.0f}ms", now)
+        if self.level > 0 and (temp is None or temp < self.cool_temp) and inference_seconds > 0:
+            expected = inference_seconds * self._upscale_cost()
+            if expected < self.headroom * self.latency_budget:
+                temp_text = "temp n/a" if temp is None else f"temp {temp:.1f}C < {self.cool_temp:.0f}C"
+                return self._switch(self.level - 1, f"{temp_text}, latency {latency_ms:.0f}ms", now)
+        return False
+
+    def _switch(self, level: int, reason: str, now: float) -> bool:
+        self.level = level
+        self.reason = reason
+        self._last_switch = now
+        return True
@@ -0,0 +1,203 @@
+# logsink.py - Buffered writer for the daily count and event logs
+# Lines are kept in memory and written in batches by a background thread, so the SD card
+# sees one write every few seconds instead of an open/append/close per line.
+
+import os
+import csv
+import io
+import threading
+from collections import deque
+from datetime import datetime
+
+LOG_FORMATS = ("text", "csv")
+FSYNC_POLICIES = ("none", "flush", "rotate")
+COUNT_TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+class LogSink:
+    """Daily log files for one camera, <YYYYMMDD>-<location>-<camera_id>.log, written in batches.
+
+    write() queues a ready-made text line; counts() queues a count record, as a text line in
+    the .log or, with log_format "csv", as a row of a .csv file that starts with a header.
+    A background thread writes the queue every flush_seconds, or sooner once max_lines are
+    waiting, a count record is queued or flush() is called. Files are named by each record's
+    own date, so a batch that spans midnight lands in both days' files; the previous day's
+    files are closed then. Each file gets its part of a batch in one os.write on an O_APPEND
+    descriptor, so another process appending to the same log never splits a line.
+
+    fsync: "none" leaves syncing to the OS, "flush" syncs after every batch and "rotate"
+    only when a day's file is closed. Lines that fail to write (card full, remounted
+    read-only) are kept and retried, up to max_buffered lines waiting in all; beyond that
+    the oldest are dropped, counted in dropped and reported after the batch. close()
+    retries failed lines once more and reports any it has to drop.
+    """
+
+    def __init__(self, log_dir: str, location: str, camera_id: str, log_format: str = "text",
+                 flush_seconds: float = 30.0, fsync: str = "flush", max_lines: int = 256,
+                 max_buffered: int = 100000):
+        if log_format not in LOG_FORMATS:
+            raise ValueError(f"Unknown log format '{log_format}'. Choose from {list(LOG_FORMATS)}")
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}'. Choose from {list(FSYNC_POLICIES)}")
+        self.log_dir = log_dir
+        self.prefix = f"{location}-{camera_id}"
+        self.log_format = log_format
+        self.flush_seconds = flush_seconds
+        self.fsync = fsync
+        self.max_lines = max_lines
+        self.max_buffered = max(1, max_buffered)
+        self.pending = deque()  # (day, path, header, line)
+        self.dropped = 0  # lines dropped because max_buffered were waiting
+        self._reported_drops = 0
+        self.cond = threading.Condition()
+        self.files = {}  # path -> (day, file descriptor)
+        self._flush_requested = False
+        self._taken = 0  # batches taken from the queue
+        self._written = 0  # batches written, for flush() to wait on
+        self._closed = False
+        os.makedirs(log_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._writer, name="log writer", daemon=True)
+        self._thread.start()
+
+    def path(self, now: datetime, extension: str = "log") -> str:
+        return os.path.join(self.log_dir, f"{now.strftime('%Y%m%d')}-{self.prefix}.{extension}")
+
+    def write(self, now: datetime, line: str) -> None:
+        """Queue one line (without newline) for the .log file of now's date."""
+        self._put(now, self.path(now), None, line)
+
+    def counts(self, now: datetime, mode: str, counts: dict) -> None:
+        """Queue a count record, "<time>, <mode>, class:count, ..." or a CSV row, and write it soon."""
+        timestamp = now.strftime(COUNT_TIME_FORMAT)
+        if self.log_format == "text":
+            counts_str = ", ".join(f"{cls}:{count}" for cls, count in counts.items())
+            self._put(now, self.path(now), None, f"{timestamp}, {mode}, {counts_str}", flush=True)
+        else:
+            self._put(now, self.path(now, "csv"), self._csv_row(["timestamp", "mode", *counts]),
+                      self._csv_row([timestamp, mode, *counts.values()]), flush=True)
+
+    @staticmethod
+    def _csv_row(values) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="").writerow(values)
+        return buffer.getvalue()
+
+    def _put(self, now: datetime, path: str, header: str | None, line: str, flush: bool = False) -> None:
+        with self.cond:
+            if self._closed:
+                raise ValueError("Log sink is closed")
+            self.pending.append((now.strftime("%Y%m%d"), path, header, line))
+            self._trim()
+            # Count records are the data that matters; they are not left waiting in memory
+            self._flush_requested |= flush
+            if flush or len(self.pending) >= self.max_lines:
+                self.cond.notify_all()
+
+    def flush(self, timeout: float | None = 10.0) -> bool:
+        """Write everything queued so far and wait for it; False if that took longer than timeout."""
+        with self.cond:
+            # The next batch taken holds everything queued until now
+            target = self._taken + 1
+            self._flush_requested = True
+            self.cond.notify_all()
+            return self.cond.wait_for(lambda: self._written >= target or not self._thread.is_alive(), timeout)
+
+    def close(self) -> None:
+        with self.cond:
+            self._closed = True
+            self.cond.notify_all()
+        self._thread.join()
+
+    def _writer(self) -> None:
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self._closed or self._flush_requested
+                                   or len(self.pending) >= self.max_lines, self.flush_seconds)
+                batch = list(self.pending)
+                self.pending.clear()
+                self._flush_requested = False
+                self._taken += 1
+                taken = self._taken
+                closing = self._closed
+            failed = self._write_batch(batch)
+            if closing and failed:
+                # Last chance: retry once, then say what is lost rather than drop it silently
+                failed = self._write_batch(failed)
+                if failed:
+                    print(f"[WARNING] Log closed with {len(failed)} lines that could not be written; dropped.")
+                    failed = []
+            with self.cond:
+                if failed:
+                    # Failed lines are older than anything queued since, so they go first
+                    self.pending.extendleft(reversed(failed))
+                    self._trim()
+                dropped = self.dropped - self._reported_drops
+                self._reported_drops = self.dropped
+                self._written = taken
+                self.cond.notify_all()
+            if dropped:
+                print(f"[WARNING] Log buffer full ({self.max_buffered} lines); dropped the {dropped} oldest.")
+            if closing:
+                self._close_files(None)
+                return
+
+    def _trim(self) -> None:
+        """Drop the oldest lines beyond max_buffered; call with the lock held."""
+        while len(self.pending) > self.max_buffered:
+            self.pending.popleft()
+            self.dropped += 1
+
+    def _write_batch(self, batch: list) -> list:
+        """Write a batch, grouped by file; returns the lines that could not be written."""
+        by_path = {}
+        for day, path, header, line in batch:
+            by_path.setdefault(path, (day, header, []))[2].append(line)
+        failed = []
+        for path, (day, header, lines) in by_path.items():
+            try:
+                fd = self._open(day, path)
+                data = "".join(f"{line}\n" for line in lines)
+                if header is not None and os.fstat(fd).st_size == 0:
+                    data = f"{header}\n{data}"
+                self._write_all(fd, data.encode())
+                if self.fsync == "flush":
+                    os.fsync(fd)
+            except OSError as e:
+                print(f"[WARNING] Could not write {len(lines)} log lines to {path}: {e}")
+                failed.extend((day, path, header, line) for line in lines)
+                # Reopen on the retry rather than reuse a handle that may have gone bad
+                stale = self.files.pop(path, None)
+                if stale is not None:
+                    try:
+                        os.close(stale[1])
+                    except OSError:
+                        pass
+        if batch:
+            # Files of earlier days will not be written again
+            self._close_files(batch[-1][0])
+        return failed
+
+    def _open(self, day: str, path: str) -> int:
+        if path not in self.files:
+            self.files[path] = (day, os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644))
+        return self.files[path][1]
+
+    @staticmethod
+    def _write_all(fd: int, data: bytes) -> None:
+        # A regular file takes the whole batch in one write; loop only for a short write
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+    def _close_files(self, today: str | None) -> None:
+        """Close the files of days before today, or all of them."""
+        for path, (day, fd) in list(self.files.items()):
+            if today is not None and day >= today:
+                continue
+            del self.files[path]
+            try:
+                if self.fsync != "none":
+                    os.fsync(fd)
+                os.close(fd)
+            except OSError as e:
+                print(f"[WARNING] Could not close log {path}: {e}")
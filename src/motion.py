@@ -0,0 +1,94 @@
+# motion.py - Cheap motion detection on a downscaled copy of each frame
+# Used to skip inference while the scene is empty and still, and to put the pipeline to
+# sleep (reading a frame or two a second) until something moves.
+
+import time
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Running-average background on a small grayscale frame; reports whether enough pixels changed.
+
+    The small frame is split into a grid of regions (columns x rows); after each update,
+    region_counts holds the changed pixels in each, as a rows x columns array.
+    """
+
+    def __init__(self, size: tuple = (160, 120), threshold: int = 25, min_fraction: float = 0.002,
+                 learning_rate: float = 0.05, grid: tuple = (4, 3)):
+        if size[0] % grid[0] or size[1] % grid[1]:
+            raise ValueError(f"Motion grid {grid} does not divide the frame size {size}")
+        self.size = size
+        self.grid = grid
+        self.threshold = threshold
+        self.min_fraction = min_fraction
+        self.learning_rate = learning_rate
+        self.background = None
+        self.fraction = 0.0
+        self.region_counts = np.zeros((grid[1], grid[0]), dtype=np.int64)
+        self._small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self._gray = np.empty((size[1], size[0]), dtype=np.uint8)
+        self._background8 = np.empty((size[1], size[0]), dtype=np.uint8)
+        self._diff = np.empty((size[1], size[0]), dtype=np.uint8)
+        self._changed = np.empty((size[1], size[0]), dtype=np.uint8)
+
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        if frame.ndim == 2:
+            cv2.resize(frame, self.size, dst=self._gray, interpolation=cv2.INTER_AREA)
+        else:
+            cv2.resize(frame, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        return self._gray
+
+    def update(self, frame: np.ndarray) -> bool:
+        """Feed one frame; True if it differs enough from the background to count as motion."""
+        gray = self._prepare(frame)
+        if self.background is None:
+            self.background = gray.astype(np.float32)
+            self.fraction = 1.0
+            self.region_counts[:] = self._diff.size // self.region_counts.size
+            return True
+
+        cv2.convertScaleAbs(self.background, dst=self._background8)
+        cv2.absdiff(gray, self._background8, dst=self._diff)
+        cv2.threshold(self._diff, self.threshold, 1, cv2.THRESH_BINARY, dst=self._changed)
+        columns, rows = self.grid
+        h, w = self._changed.shape
+        self.region_counts[:] = self._changed.reshape(rows, h // rows, columns, w // columns).sum(axis=(1, 3))
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        self.fraction = int(self.region_counts.sum()) / self._diff.size
+        return bool(self.fraction >= self.min_fraction)
+
+
+class MotionSleep:
+    """Low-power state for motion-based activation.
+
+    After sleep_after seconds in which no frame had motion or a live track, the pipeline
+    falls asleep: it reads the camera only fps times a second and runs nothing but the
+    motion gate on those frames. The first frame with motion wakes it to the full rate.
+    """
+
+    def __init__(self, sleep_after: float = 30.0, fps: float = 2.0):
+        self.sleep_after = sleep_after
+        self.interval = 1.0 / fps
+        self.awake = True
+        self.asleep_seconds = 0.0
+        self.wakeups = 0
+        self._last_active = None
+        self._asleep_since = None
+
+    def update(self, active: bool, now: float | None = None) -> bool:
+        """Record whether the latest frame had motion or a live track; True if the state changed."""
+        now = time.monotonic() if now is None else now
+        if self._last_active is None or active:
+            self._last_active = now
+        if self.awake and now - self._last_active >= self.sleep_after:
+            self.awake = False
+            self._asleep_since = now
+            return True
+        if not self.awake and active:
+            self.awake = True
+            self.asleep_seconds += now - self._asleep_since
+            self.wakeups += 1
+            return True
+        return False
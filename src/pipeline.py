@@ -0,0 +1,222 @@
+# pipeline.py - Capture, inference and tracking as separate stages
+# Camera reads and inference run on their own threads, joined by small bounded queues,
+# so a slow inference never stalls the camera and stale frames are dropped, not queued.
+
+import time
+import threading
+from collections import deque
+import numpy as np
+
+POLICIES = ("block", "drop_oldest", "latest")
+# After a sleep pause, grab at most this many frames to empty the driver's buffer (V4L2 keeps ~4)
+MAX_DRAIN_GRABS = 8
+# A grab that returns sooner than this came from the buffer rather than waiting on the camera
+DRAIN_WAIT_SECONDS = 0.005
+
+
+class FrameQueue:
+    """Bounded hand-off between two pipeline stages.
+
+    Policies when the queue is full:
+        block: the producer waits (lossless, for video files).
+        drop_oldest: the oldest queued item is discarded.
+        latest: everything queued is discarded, so the consumer only sees the newest item.
+    """
+
+    def __init__(self, maxsize: int = 2, policy: str = "drop_oldest"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}'. Choose from {list(POLICIES)}")
+        self.maxsize = 1 if policy == "latest" else max(1, maxsize)
+        self.policy = policy
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.puts = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._depth_total = 0
+
+    def put(self, item) -> None:
+        with self.cond:
+            if self.policy == "block":
+                while len(self.items) >= self.maxsize and not self.closed:
+                    self.cond.wait()
+            if self.closed:
+                return
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.puts += 1
+            self.max_depth = max(self.max_depth, len(self.items))
+            self._depth_total += len(self.items)
+            self.cond.notify_all()
+
+    def get(self):
+        """Next item, or None once the queue is closed and drained."""
+        with self.cond:
+            while not self.items and not self.closed:
+                self.cond.wait()
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self) -> None:
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "depth": len(self.items),
+                "max_depth": self.max_depth,
+                "mean_depth": self._depth_total / self.puts if self.puts else 0.0,
+                "puts": self.puts,
+                "dropped": self.dropped,
+            }
+
+
+class Pipeline:
+    """Runs capture and inference on worker threads; iterate it on the main thread to track.
+
+    Iterating yields (frame_index, frame, detections). frame_index counts camera frames,
+    so the gap between consecutive items is the dt to pass to Sort.update, whether frames
+    were skipped on purpose or dropped under load.
+
+    frame_skip may be changed while running (e.g. by FrameSkipScheduler); it applies from
+    the next frame sent to inference. inference_seconds is a moving average of detector time.
+    preprocess, if set (and changeable while running), maps each frame before the detector;
+    the frame yielded is always the camera's own. luminance, if set, is a LuminanceEstimator
+    updated from every frame sent to inference, so its value is always current.
+
+    With a motion gate, the capture stage compares every camera frame with the background,
+    skipped ones included, so the gate's view does not depend on frame_skip. The detector is
+    skipped (and empty detections are passed on) for frames with no motion since the last
+    frame sent while tracks_alive() is False, i.e. nothing is left to follow. While the
+    detector is idle like that, a frame with motion is sent at once rather than at the next
+    scheduled index, so waking up does not wait out the skip. sleep, a MotionSleep (which
+    needs the gate), lets the capture stage drop to sampling a frame or two a second while
+    that lasts. Frames not read while asleep are not counted
+    in frame_index; no track is alive then, so the tracker has nothing to predict across.
+    """
+
+    def __init__(self, cap, detector, frame_skip: int = 1, depth: int = 2, policy: str = "drop_oldest",
+                 gate=None, tracks_alive=None, preprocess=None, luminance=None, sleep=None):
+        if sleep is not None and gate is None:
+            raise ValueError("Motion sleep needs a motion gate to wake it")
+        self.cap = cap
+        self.detector = detector
+        self.preprocess = preprocess
+        self.luminance = luminance
+        self.gate = gate
+        self.sleep = sleep
+        self.tracks_alive = tracks_alive or (lambda: False)
+        self.gated_frames = 0
+        self._idle = False  # the last frame sent skipped the detector
+        self.inference_seconds = 0.0
+        self.frame_skip = max(1, frame_skip)
+        self.frames = FrameQueue(depth, policy)
+        self.results = FrameQueue(depth, policy)
+        self._stop = threading.Event()
+        self._error = None
+        self._threads = [
+            threading.Thread(target=self._capture, name="capture", daemon=True),
+            threading.Thread(target=self._infer, name="inference", daemon=True),
+        ]
+
+    def start(self) -> "Pipeline":
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _capture(self) -> None:
+        index = 0
+        next_index = 0
+        next_sample = 0.0
+        motion = False  # seen on any frame since the last one sent
+        try:
+            while not self._stop.is_set():
+                asleep = self.sleep is not None and not self.sleep.awake
+                if asleep:
+                    # Low power: sample the camera at the sleep rate; the gate wakes us on motion
+                    if self._stop.wait(max(0.0, next_sample - time.monotonic())):
+                        break
+                    next_sample = time.monotonic() + self.sleep.interval
+                ret, frame = self._read_fresh() if asleep else self.cap.read()
+                if not ret:
+                    break
+                if self.gate is not None and self.gate.update(frame):
+                    motion = True
+                if asleep or index >= next_index or (motion and self._idle):
+                    if self.luminance is not None:
+                        self.luminance.update(frame)
+                    self.frames.put((index, frame, motion))
+                    next_index = index + max(1, self.frame_skip)
+                    motion = False
+                index += 1
+        except Exception as e:
+            self._error = e
+        finally:
+            self.frames.close()
+
+    def _read_fresh(self):
+        """The camera's current frame after a sleep pause, not one it buffered while we slept.
+
+        A device keeps queuing frames while nobody reads, so a plain read() would return one
+        that is seconds old. Grabs that return at once come from that queue; the first that
+        has to wait is a new frame. The broker's SharedCamera already returns the newest
+        frame, and a video file ("block" policy) has nothing to drain.
+        """
+        if hasattr(self.cap, "latest") or self.frames.policy == "block":
+            return self.cap.read()
+        for _ in range(MAX_DRAIN_GRABS):
+            start = time.monotonic()
+            if not self.cap.grab():
+                return False, None
+            if time.monotonic() - start >= DRAIN_WAIT_SECONDS:
+                break
+        return self.cap.retrieve()
+
+    def _infer(self) -> None:
+        try:
+            while (item := self.frames.get()) is not None:
+                index, frame, motion = item
+                active = self.gate is None or motion or self.tracks_alive()
+                self._idle = not active
+                if self.sleep is not None:
+                    self.sleep.update(active)
+                if not active:
+                    self.gated_frames += 1
+                    detections = np.empty((0, 6), dtype=np.float32)
+                else:
+                    start = time.perf_counter()
+                    preprocess = self.preprocess
+                    detections = self.detector.detect(frame if preprocess is None else preprocess(frame))
+                    elapsed = time.perf_counter() - start
+                    self.inference_seconds = elapsed if self.inference_seconds == 0 else (
+                        0.9 * self.inference_seconds + 0.1 * elapsed)
+                self.results.put((index, frame, detections))
+        except Exception as e:
+            self._error = e
+            self.frames.close()
+        finally:
+            self.results.close()
+
+    def __iter__(self):
+        while (item := self.results.get()) is not None:
+            yield item
+        if self._error is not None:
+            raise self._error
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.frames.close()
+        self.results.close()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+
+    def stats(self) -> dict:
+        return {"capture": self.frames.stats(), "inference": self.results.stats()}
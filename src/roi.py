@@ -0,0 +1,118 @@
+# roi.py - Region of interest for a camera: crop inference to the road, drop the rest
+# The polygon is given in frame pixels in config.yaml, per camera id, for the reference view;
+# small camera drift found by the alignment check is corrected by moving it.
+
+import os
+import math
+import time
+import cv2
+import numpy as np
+from alignment import load_alignment
+
+
+class RegionOfInterest:
+    """Polygon ROI with its bounding crop and a per-pixel inside/outside mask."""
+
+    def __init__(self, polygon):
+        self.polygon = np.asarray(polygon, dtype=np.int32).reshape(-1, 2)
+        x, y, w, h = cv2.boundingRect(self.polygon)
+        self.box = (x, y, x + w, y + h)
+        self._mask = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RegionOfInterest | None":
+        """The camera's polygon, moved by the drift correction the alignment check saved, if any."""
+        polygon = (config.get('roi') or {}).get(config['camera_id'])
+        if not polygon or len(polygon) < 3:
+            return None
+        alignment = load_alignment(config.get('alignment_file'))
+        if alignment is not None:
+            polygon = np.rint(alignment.transform(polygon))
+        return cls(polygon)
+
+    def crop_box(self, frame_shape: tuple) -> tuple:
+        """Bounding box of the polygon clipped to the frame, as (x1, y1, x2, y2)."""
+        h, w = frame_shape[:2]
+        x1, y1, x2, y2 = self.box
+        return max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+
+    def scaled_imgsz(self, imgsz: int, frame_size: tuple, stride: int = 32) -> int:
+        """Inference size that gives the crop the same pixels per metre as imgsz gives the full frame."""
+        x1, y1, x2, y2 = self.crop_box((frame_size[1], frame_size[0]))
+        scale = imgsz / max(frame_size)
+        return max(stride, math.ceil(max(x2 - x1, y2 - y1) * scale / stride) * stride)
+
+    def mask(self, frame_shape: tuple) -> np.ndarray:
+        if self._mask is None or self._mask.shape != frame_shape[:2]:
+            filled = cv2.fillPoly(np.zeros(frame_shape[:2], dtype=np.uint8), [self.polygon], 1)
+            self._mask = filled.astype(bool)
+        return self._mask
+
+    def contains(self, dets: np.ndarray, frame_shape: tuple) -> np.ndarray:
+        """Whether each box's bottom centre, where it touches the road, lies inside the polygon."""
+        h, w = frame_shape[:2]
+        px = np.clip(((dets[:, 0] + dets[:, 2]) / 2).astype(np.int64), 0, w - 1)
+        py = np.clip(dets[:, 3].astype(np.int64), 0, h - 1)
+        return self.mask(frame_shape)[py, px]
+
+
+class RoiDetector:
+    """Wraps a detector so it only sees the ROI crop and only returns boxes inside the polygon."""
+
+    def __init__(self, detector, roi: RegionOfInterest):
+        self.detector = detector
+        self.roi = roi
+
+    def __getattr__(self, name):
+        return getattr(self.detector, name)
+
+    def __setattr__(self, name, value):
+        # Settings such as conf_threshold belong to the wrapped detector
+        if name in ("detector", "roi"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.detector, name, value)
+
+    def warmup(self) -> None:
+        self.detector.warmup()
+
+    def detect(self, frame: np.ndarray) -> np.ndarray:
+        roi = self.roi  # the counter may swap in a reprojected ROI between frames
+        x1, y1, x2, y2 = roi.crop_box(frame.shape)
+        dets = self.detector.detect(frame[y1:y2, x1:x2])
+        dets[:, :4] += (x1, y1, x1, y1)
+        return dets[roi.contains(dets, frame.shape)]
+
+    def detect_batch(self, frames: list) -> list:
+        return [self.detect(frame) for frame in frames]
+
+
+class AlignmentWatcher:
+    """Notices when the alignment check saves or removes its correction, to move the ROI.
+
+    Checks the alignment file's mtime at most every interval seconds; poll() returns the
+    camera's ROI rebuilt from the config when the file changed, else None.
+    """
+
+    def __init__(self, config: dict, interval: float = 60.0):
+        self.config = config
+        self.interval = interval
+        self._mtime = self._file_mtime()
+        self._next_check = time.monotonic() + interval
+
+    def _file_mtime(self):
+        try:
+            return os.path.getmtime(self.config['alignment_file'])
+        except (OSError, TypeError):
+            return None
+
+    def poll(self, now: float | None = None) -> RegionOfInterest | None:
+        now = time.monotonic() if now is None else now
+        if now < self._next_check:
+            return None
+        self._next_check = now + self.interval
+        mtime = self._file_mtime()
+        if mtime == self._mtime:
+            return None
+        self._mtime = mtime
+        return RegionOfInterest.from_config(self.config)
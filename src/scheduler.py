@@ -0,0 +1,77 @@
+# scheduler.py - Adaptive frame skip driven by scene activity and a CPU budget
+# Run inference often when fast vehicles are in view, rarely when the scene is empty or slow.
+
+import math
+import numpy as np
+
+# Kalman updates (hits, which start at 0 for a new track) before its velocity is trusted
+MIN_VELOCITY_HITS = 2
+
+
+class FrameSkipScheduler:
+    """Chooses how many camera frames to advance between inferences.
+
+    Two limits are combined:
+      * motion: the fastest live track (from the Kalman velocity terms) may move at most
+        max_displacement of its own width between inferences, so IoU association still holds.
+        Tracks seen fewer than three times (the detection that started them plus fewer than
+        MIN_VELOCITY_HITS updates) have no settled velocity yet and keep the skip at min_skip.
+      * CPU: inference may use at most cpu_budget of one core, given the measured
+        inference time and the camera frame rate.
+    The CPU limit wins if they disagree. With no live tracks the skip goes to max_skip.
+    """
+
+    def __init__(self, fps: float, min_skip: int = 1, max_skip: int = 8, cpu_budget: float = 0.5,
+                 max_displacement: float = 0.3):
+        self.fps = fps
+        self.min_skip = min_skip
+        self.max_skip = max_skip
+        self.cpu_budget = cpu_budget
+        self.max_displacement = max_displacement
+        self.skip = min_skip
+        self._reset_stats()
+
+    def _reset_stats(self) -> None:
+        self._updates = 0
+        self._skip_total = 0
+        self._skip_min = None
+        self._skip_max = None
+
+    def motion_skip(self, bank) -> int:
+        if len(bank) == 0:
+            return self.max_skip
+        if np.any(bank.hits < MIN_VELOCITY_HITS):
+            return self.min_skip
+        width = np.sqrt(np.maximum(bank.x[:, 2] * bank.x[:, 3], 1.0))
+        speed = np.hypot(bank.x[:, 4], bank.x[:, 5])  # pixels per camera frame
+        widths_per_frame = float(np.max(speed / width))
+        if widths_per_frame <= 0:
+            return self.max_skip
+        return math.floor(self.max_displacement / widths_per_frame)
+
+    def cpu_skip(self, inference_seconds: float) -> int:
+        return math.ceil(inference_seconds * self.fps / self.cpu_budget)
+
+    def update(self, bank, inference_seconds: float) -> int:
+        """New frame skip given the tracker's KalmanBoxBank and the mean inference time."""
+        skip = max(self.motion_skip(bank), self.cpu_skip(inference_seconds))
+        self.skip = int(min(self.max_skip, max(self.min_skip, skip)))
+
+        self._updates += 1
+        self._skip_total += self.skip
+        self._skip_min = self.skip if self._skip_min is None else min(self._skip_min, self.skip)
+        self._skip_max = self.skip if self._skip_max is None else max(self._skip_max, self.skip)
+        return self.skip
+
+    def pop_stats(self) -> dict | None:
+        """Mean/min/max frame skip since the last call, then start a new interval."""
+        if self._updates == 0:
+            return None
+        stats = {
+            "mean": self._skip_total / self._updates,
+            "min": self._skip_min,
+            "max": self._skip_max,
+            "inferences": self._updates,
+        }
+        self._reset_stats()
+        return stats
@@ -2,168 +2,347 @@
 # Lightweight object tracker for edge devices
 
 import numpy as np
-from filterpy.kalman import KalmanFilter
-
-class KalmanBoxTracker:
-    count = 0
-
-    def __init__(self, bbox):
-        self.kf = KalmanFilter(dim_x=7, dim_z=4)
-        self.kf.F = np.array([[1, 0, 0, 0, 1, 0, 0],
-                              [0, 1, 0, 0, 0, 1, 0],
-                              [0, 0, 1, 0, 0, 0, 1],
-                              [0, 0, 0, 1, 0, 0, 0],
-                              [0, 0, 0, 0, 1, 0, 0],
-                              [0, 0, 0, 0, 0, 1, 0],
-                              [0, 0, 0, 0, 0, 0, 1]])
-        self.kf.H = np.array([[1, 0, 0, 0, 0, 0, 0],
-                              [0, 1, 0, 0, 0, 0, 0],
-                              [0, 0, 1, 0, 0, 0, 0],
-                              [0, 0, 0, 1, 0, 0, 0]])
-        self.kf.R[2:,2:] *= 10.
-        self.kf.P[4:,4:] *= 1000.
-        self.kf.P *= 10.
-        self.kf.Q[-1,-1] *= 0.01
-        self.kf.Q[4:,4:] *= 0.01
-        self.kf.x[:4] = self.convert_bbox_to_z(bbox)
-        self.time_since_update = 0
-        self.id = KalmanBoxTracker.count
-        KalmanBoxTracker.count += 1
-        self.history = []
-        self.hits = 0
-        self.hit_streak = 0
-        self.age = 0
-
-    def update(self, bbox):
-        self.time_since_update = 0
-        self.history = []
-        self.hits += 1
-        self.hit_streak += 1
-        self.kf.update(self.convert_bbox_to_z(bbox))
-
-    def predict(self):
-        if (self.kf.x[6] + self.kf.x[2]) <= 0:
-            self.kf.x[6] *= 0.0
-        self.kf.predict()
-        self.age += 1
-        if self.time_since_update > 0:
-            self.hit_streak = 0
-        self.time_since_update += 1
-        self.history.append(self.convert_x_to_bbox(self.kf.x))
-        return self.history[-1]
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+class KalmanBoxBank:
+    """Constant-velocity Kalman filters for every live track, stored as stacked arrays.
+
+    Row i of each array belongs to the same track. State is [x, y, s, r, vx, vy, vs]
+    where (x, y) is the box centre, s its area and r its aspect ratio. Each track also
+    keeps confidence-weighted class votes over its lifetime, so its reported class is
+    the one it was detected as most strongly rather than the last one seen.
+    """
+
+    F = np.array([[1, 0, 0, 0, 1, 0, 0],
+                  [0, 1, 0, 0, 0, 1, 0],
+                  [0, 0, 1, 0, 0, 0, 1],
+                  [0, 0, 0, 1, 0, 0, 0],
+                  [0, 0, 0, 0, 1, 0, 0],
+                  [0, 0, 0, 0, 0, 1, 0],
+                  [0, 0, 0, 0, 0, 0, 1]], dtype=np.float64)
+    H = np.eye(4, 7)
+    R = np.diag([1., 1., 10., 10.])
+    Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+    P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.])
+
+    def __init__(self):
+        self.next_id = 0
+        self.x = np.empty((0, 7))
+        self.P = np.empty((0, 7, 7))
+        self.ids = np.empty((0,), dtype=np.int64)
+        self.time_since_update = np.empty((0,), dtype=np.int64)
+        self.hits = np.empty((0,), dtype=np.int64)
+        self.hit_streak = np.empty((0,), dtype=np.int64)
+        self.age = np.empty((0,), dtype=np.int64)
+        self.conf = np.empty((0,))
+        self.votes = np.zeros((0, 1))
+
+    def __len__(self):
+        return len(self.x)
+
+    def add(self, dets):
+        n = len(dets)
+        if n == 0:
+            return
+        x = np.zeros((n, 7))
+        x[:, :4] = convert_bbox_to_z(dets[:, :4])
+        ids = np.arange(self.next_id, self.next_id + n)
+        self.next_id += n
+        zeros = np.zeros(n, dtype=np.int64)
+
+        self.x = np.concatenate((self.x, x))
+        self.P = np.concatenate((self.P, np.broadcast_to(self.P0, (n, 7, 7))))
+        self.ids = np.concatenate((self.ids, ids))
+        self.time_since_update = np.concatenate((self.time_since_update, zeros))
+        self.hits = np.concatenate((self.hits, zeros))
+        self.hit_streak = np.concatenate((self.hit_streak, zeros))
+        self.age = np.concatenate((self.age, zeros))
+        self.conf = np.concatenate((self.conf, np.zeros(n)))
+        self.votes = np.concatenate((self.votes, np.zeros((n, self.votes.shape[1]))))
+        self._vote(np.arange(len(self) - n, len(self)), dets)
+
+    def _vote(self, idx, dets):
+        conf = dets[:, 4] if dets.shape[1] > 4 else np.ones(len(dets))
+        self.conf[idx] = conf
+        if dets.shape[1] <= 5:
+            return
+        cls = dets[:, 5].astype(np.int64)
+        if cls.max(initial=-1) >= self.votes.shape[1]:
+            grow = cls.max() + 1 - self.votes.shape[1]
+            self.votes = np.hstack((self.votes, np.zeros((len(self), grow))))
+        np.add.at(self.votes, (idx, cls), conf)
+
+    def predict(self, dt=1):
+        """Advance all tracks by dt frames, so skipped frames still move boxes by their velocity."""
+        F = self.F
+        Q = self.Q
+        if dt != 1:
+            F = np.eye(7)
+            F[[0, 1, 2], [4, 5, 6]] = dt
+            Q = self.Q * dt
+        self.x[(self.x[:, 6] * dt + self.x[:, 2]) <= 0, 6] = 0.
+        self.x = self.x @ F.T
+        self.P = F @ self.P @ F.T + Q
+        # Ages count camera frames, so a lost track lasts as long in seconds whatever the skip
+        self.age += dt
+        self.hit_streak[self.time_since_update > 0] = 0
+        self.time_since_update += dt
+        return self.get_state()
+
+    def update(self, idx, dets):
+        if len(idx) == 0:
+            return
+        x = self.x[idx]
+        P = self.P[idx]
+
+        y = convert_bbox_to_z(dets[:, :4]) - x[:, :4]
+        S = P[:, :4, :4] + self.R
+        K = P[:, :, :4] @ np.linalg.inv(S)
+        x = x + (K @ y[:, :, None])[:, :, 0]
+        # Joseph form, as filterpy does, to keep P symmetric positive definite
+        I_KH = np.eye(7) - K @ self.H
+        P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
+
+        self.x[idx] = x
+        self.P[idx] = P
+        self.time_since_update[idx] = 0
+        self.hits[idx] += 1
+        self.hit_streak[idx] += 1
+        self._vote(idx, dets)
+
+    def keep(self, mask):
+        """Drop the tracks where mask is False and return their ids."""
+        if mask.all():
+            return self.ids[:0]
+        removed = self.ids[~mask]
+        self.x = self.x[mask]
+        self.P = self.P[mask]
+        self.ids = self.ids[mask]
+        self.time_since_update = self.time_since_update[mask]
+        self.hits = self.hits[mask]
+        self.hit_streak = self.hit_streak[mask]
+        self.age = self.age[mask]
+        self.conf = self.conf[mask]
+        self.votes = self.votes[mask]
+        return removed
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.x, self.P, self.ids, self.time_since_update,
+                                      self.hits, self.hit_streak, self.age, self.conf, self.votes))
 
     def get_state(self):
-        return self.convert_x_to_bbox(self.kf.x)
-
-    @staticmethod
-    def convert_bbox_to_z(bbox):
-        w = bbox[2] - bbox[0]
-        h = bbox[3] - bbox[1]
-        x = bbox[0] + w / 2.
-        y = bbox[1] + h / 2.
-        s = w * h
-        r = w / float(h)
-        return np.array([[x], [y], [s], [r]])
-
-    @staticmethod
-    def convert_x_to_bbox(x):
-        w = np.sqrt(x[2] * x[3])
-        h = x[2] / w
-        return np.array([x[0] - w / 2., x[1] - h / 2.,
-                         x[0] + w / 2., x[1] + h / 2.]).reshape((4,))
+        return convert_x_to_bbox(self.x)
+
+    def get_class(self):
+        """Class id with the most votes per track, or -1 for tracks never given a class."""
+        return np.where(self.votes.any(axis=1), self.votes.argmax(axis=1), -1)
+
+
+def convert_bbox_to_z(bbox):
+    bbox = np.asarray(bbox, dtype=np.float64)
+    w = bbox[:, 2] - bbox[:, 0]
+    h = bbox[:, 3] - bbox[:, 1]
+    x = bbox[:, 0] + w / 2.
+    y = bbox[:, 1] + h / 2.
+    s = w * h
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = w / h
+    return np.stack((x, y, s, r), axis=1)
+
+
+def convert_x_to_bbox(x):
+    with np.errstate(invalid='ignore'):
+        w = np.sqrt(x[:, 2] * x[:, 3])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h = x[:, 2] / w
+    return np.stack((x[:, 0] - w / 2., x[:, 1] - h / 2.,
+                     x[:, 0] + w / 2., x[:, 1] + h / 2.), axis=1)
 
 
 class Sort:
-    def __init__(self, max_age=5, min_hits=3):
+    def __init__(self, max_age=5, min_hits=3, iou_threshold=0.3, solver='hungarian',
+                 high_threshold=0.5, low_threshold=0.1, low_iou_threshold=0.5):
+        if solver not in SOLVERS:
+            raise ValueError(f"Unknown association solver '{solver}'. Choose from {list(SOLVERS)}")
         self.max_age = max_age
         self.min_hits = min_hits
-        self.trackers = []
+        self.iou_threshold = iou_threshold
+        self.solver = solver
+        self.high_threshold = high_threshold
+        self.low_threshold = low_threshold
+        self.low_iou_threshold = low_iou_threshold
+        self.trackers = KalmanBoxBank()
         self.frame_count = 0
+        self.removed_ids = np.empty((0,), dtype=np.int64)
+
+    @property
+    def nbytes(self):
+        """Bytes held by track state; stays flat as long as the number of live tracks does."""
+        return self.trackers.nbytes
+
+    def update(self, dets=np.empty((0, 6)), dt=1):
+        """Advance all tracks by one processed frame.
+
+        Association runs in two stages, as in ByteTrack: detections with conf >= high_threshold
+        are matched against every track and may start new ones; detections between
+        low_threshold and high_threshold are then only used to keep the still unmatched
+        tracks alive (e.g. a partly occluded cyclist), never to start a track.
+
+        Args:
+            dets: N x 5 [x1, y1, x2, y2, conf] or N x 6 [x1, y1, x2, y2, conf, cls] detections.
+            dt: Camera frames since the previous call, i.e. the frame skip. max_age counts
+                camera frames too, so skipping frames does not stretch a lost track's lifetime;
+                a track always survives one missed inference, even when dt exceeds max_age.
 
-    def update(self, dets=np.empty((0, 5))):
+        Returns:
+            M x 7 array of [x1, y1, x2, y2, id, cls, conf] for confirmed tracks seen this frame.
+            cls is the track's voted class id, or -1 when detections carry no class column.
+        """
         self.frame_count += 1
-        trks = []
-        to_del = []
-        ret = []
-        for t in range(len(self.trackers)):
-            pos = self.trackers[t].predict()
-            if np.any(np.isnan(pos)):
-                to_del.append(t)
-            else:
-                trks.append(pos)
-        for t in reversed(to_del):
-            self.trackers.pop(t)
-        matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, trks)
-
-        for m in matched:
-            self.trackers[m[1]].update(dets[m[0], :])
-
-        for i in unmatched_dets:
-            trk = KalmanBoxTracker(dets[i, :])
-            self.trackers.append(trk)
-
-        i = len(self.trackers)
-        for trk in reversed(self.trackers):
-            d = trk.get_state()
-            if (trk.time_since_update < 1) and (trk.hits >= self.min_hits or self.frame_count <= self.min_hits):
-                ret.append(np.concatenate((d, [trk.id])).reshape(1, -1))
-            i -= 1
-            if trk.time_since_update > self.max_age:
-                self.trackers.pop(i)
-        if len(ret) > 0:
-            return np.concatenate(ret)
-        return np.empty((0, 5))
+        dets = np.asarray(dets, dtype=np.float64)
+        if len(dets) == 0:
+            dets = np.empty((0, 6))
+        trks = self.trackers.predict(dt)
+        valid = ~np.any(np.isnan(trks), axis=1)
+        removed = [self.trackers.keep(valid)]
+        trks = trks[valid]
+
+        high = np.flatnonzero(dets[:, 4] >= self.high_threshold)
+        low = np.flatnonzero((dets[:, 4] >= self.low_threshold) & (dets[:, 4] < self.high_threshold))
+
+        matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(
+            dets[high], trks, self.iou_threshold, self.solver)
+        self.trackers.update(matched[:, 1], dets[high[matched[:, 0]]])
+
+        matched_low, _, _ = associate_detections_to_trackers(
+            dets[low], trks[unmatched_trks], self.low_iou_threshold, self.solver)
+        self.trackers.update(unmatched_trks[matched_low[:, 1]], dets[low[matched_low[:, 0]]])
+
+        self.trackers.add(dets[high[unmatched_dets]])
+
+        bank = self.trackers
+        confirmed = (bank.hits >= self.min_hits) | (self.frame_count <= self.min_hits)
+        out = (bank.time_since_update < 1) & confirmed
+        # Newest tracks first, matching the order the per-object tracker list used to report
+        ret = np.hstack((bank.get_state()[out], bank.ids[out, None],
+                         bank.get_class()[out, None], bank.conf[out, None]))[::-1]
+        removed.append(bank.keep(bank.time_since_update <= max(self.max_age, dt)))
+        # Ids of tracks deleted during this call, so callers can drop per-track state
+        self.removed_ids = np.concatenate(removed)
 
+        if len(ret) > 0:
+            return ret
+        return np.empty((0, 7))
 
-def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3):
-    from scipy.optimize import linear_sum_assignment
 
+def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3, solver='hungarian'):
     if len(trackers) == 0:
-        return np.empty((0, 2), dtype=int), np.arange(len(detections)), []
+        return np.empty((0, 2), dtype=int), np.arange(len(detections)), np.empty((0,), dtype=int)
 
-    iou_matrix = np.zeros((len(detections), len(trackers)), dtype=np.float32)
+    iou_matrix = iou_batch(detections, trackers)
+    matches = SOLVERS[solver](iou_matrix, iou_threshold)
 
-    for d, det in enumerate(detections):
-        for t, trk in enumerate(trackers):
-            iou_matrix[d, t] = iou(det, trk)
+    det_matched = np.zeros(len(detections), dtype=bool)
+    trk_matched = np.zeros(len(trackers), dtype=bool)
+    det_matched[matches[:, 0]] = True
+    trk_matched[matches[:, 1]] = True
 
-    row_ind, col_ind = linear_sum_assignment(-iou_matrix)
-    matched_indices = np.array(list(zip(row_ind, col_ind)))
+    return matches, np.flatnonzero(~det_matched), np.flatnonzero(~trk_matched)
 
-    unmatched_detections = []
-    for d in range(len(detections)):
-        if d not in matched_indices[:, 0]:
-            unmatched_detections.append(d)
 
-    unmatched_trackers = []
-    for t in range(len(trackers)):
-        if t not in matched_indices[:, 1]:
-            unmatched_trackers.append(t)
+# Above this many detections or trackers, the gated matrix is split into connected components
+# before solving. Per call (src/utils/benchmark_sort.py), one solve of the whole gated matrix
+# is faster at every count up to 320, and splitting only pays off in large sparse scenes.
+COMPONENT_SPLIT_SIZE = 512
 
-    matches = []
-    for m in matched_indices:
-        if iou_matrix[m[0], m[1]] < iou_threshold:
-            unmatched_detections.append(m[0])
-            unmatched_trackers.append(m[1])
-        else:
-            matches.append(m.reshape(1, 2))
 
+def _solve_block(iou_matrix, gate, rows, cols, iou_threshold):
+    sub = np.where(gate[np.ix_(rows, cols)], iou_matrix[np.ix_(rows, cols)], 0.)
+    r, c = linear_sum_assignment(sub, maximize=True)
+    ok = sub[r, c] >= iou_threshold
+    return np.stack((rows[r[ok]], cols[c[ok]]), axis=1)
+
+
+def solve_hungarian(iou_matrix, iou_threshold):
+    """Optimal assignment of the gated IoU matrix.
+
+    Pairs under the IoU threshold can never be matched, so they are zeroed and the
+    matrix is solved in one Hungarian call. Only for very large scenes is it split into
+    connected components first, with pairs that have no rival matched directly.
+    """
+    gate = iou_matrix >= iou_threshold
+    if not gate.any():
+        return np.empty((0, 2), dtype=int)
+    n, m = iou_matrix.shape
+    if max(n, m) <= COMPONENT_SPLIT_SIZE:
+        return _solve_block(iou_matrix, gate, np.arange(n), np.arange(m), iou_threshold).astype(int)
+
+    d, t = np.nonzero(gate)
+    lone = (gate.sum(axis=1)[d] == 1) & (gate.sum(axis=0)[t] == 1)
+    matches = [np.stack((d[lone], t[lone]), axis=1)]
+    d, t = d[~lone], t[~lone]
+    if len(d) > 0:
+        graph = coo_matrix((np.ones(len(d)), (d, t + n)), shape=(n + m, n + m))
+        _, labels = connected_components(graph, directed=False)
+        pair_labels = labels[d]
+        for label in np.unique(pair_labels):
+            in_group = pair_labels == label
+            matches.append(_solve_block(iou_matrix, gate, np.unique(d[in_group]),
+                                        np.unique(t[in_group]), iou_threshold))
+    return np.concatenate(matches).astype(int)
+
+
+def solve_greedy(iou_matrix, iou_threshold):
+    """Match the highest-IoU pairs first. Near-optimal when few boxes overlap, and cheaper."""
+    d, t = np.nonzero(iou_matrix >= iou_threshold)
+    order = np.argsort(-iou_matrix[d, t], kind='stable')
+    used_d = np.zeros(iou_matrix.shape[0], dtype=bool)
+    used_t = np.zeros(iou_matrix.shape[1], dtype=bool)
+    matches = []
+    for i in order:
+        if not used_d[d[i]] and not used_t[t[i]]:
+            used_d[d[i]] = used_t[t[i]] = True
+            matches.append((d[i], t[i]))
     if len(matches) == 0:
-        matches = np.empty((0, 2), dtype=int)
-    else:
-        matches = np.concatenate(matches, axis=0)
+        return np.empty((0, 2), dtype=int)
+    return np.array(matches, dtype=int)
 
-    return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
 
+SOLVERS = {
+    'hungarian': solve_hungarian,
+    'greedy': solve_greedy,
+}
 
-def iou(bb_test, bb_gt):
-    xx1 = np.maximum(bb_test[0], bb_gt[0])
-    yy1 = np.maximum(bb_test[1], bb_gt[1])
-    xx2 = np.minimum(bb_test[2], bb_gt[2])
-    yy2 = np.minimum(bb_test[3], bb_gt[3])
-    w = np.maximum(0., xx2 - xx1)
-    h = np.maximum(0., yy2 - yy1)
+
+def _as_boxes(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64)
+    if boxes.size == 0:
+        return np.empty((0, 4))
+    return np.atleast_2d(boxes)
+
+
+def iou_batch(bb_test, bb_gt):
+    """IoU between every pair of boxes in two [x1, y1, x2, y2, ...] arrays, as an N x M matrix."""
+    bb_test = _as_boxes(bb_test)
+    bb_gt = _as_boxes(bb_gt)
+    if len(bb_test) == 0 or len(bb_gt) == 0:
+        return np.zeros((len(bb_test), len(bb_gt)), dtype=np.float32)
+
+    t = bb_test[:, None, :4]
+    g = bb_gt[None, :, :4]
+    w = np.maximum(0., np.minimum(t[..., 2], g[..., 2]) - np.maximum(t[..., 0], g[..., 0]))
+    h = np.maximum(0., np.minimum(t[..., 3], g[..., 3]) - np.maximum(t[..., 1], g[..., 1]))
     wh = w * h
-    o = wh / ((bb_test[2] - bb_test[0]) * (bb_test[3] - bb_test[1]) +
-              (bb_gt[2] - bb_gt[0]) * (bb_gt[3] - bb_gt[1]) - wh)
-    return o
+    area_t = (t[..., 2] - t[..., 0]) * (t[..., 3] - t[..., 1])
+    area_g = (g[..., 2] - g[..., 0]) * (g[..., 3] - g[..., 1])
+    union = area_t + area_g - wh
+    with np.errstate(divide='ignore', invalid='ignore'):
+        o = np.where(union > 0, wh / union, 0.)
+    return o.astype(np.float32)
+
+
+def iou(bb_test, bb_gt):
+    return float(iou_batch(np.asarray(bb_test)[None, :4], np.asarray(bb_gt)[None, :4])[0, 0])
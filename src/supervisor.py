@@ -0,0 +1,261 @@
+# supervisor.py - Event-driven supervision of the unit's long-running processes
+# One loop waits on child output and timers together, so crashes, hangs and scheduled jobs
+# are handled within seconds instead of on the next pass of a one-minute sleep.
+
+import os
+import sys
+import time
+import heapq
+import logging
+import selectors
+import subprocess
+import threading
+from datetime import datetime, timedelta
+
+HEARTBEAT_PREFIX = "[HEARTBEAT]"
+READ_CHUNK = 65536
+
+
+class Heartbeat:
+    """Printed by a supervised process from its main loop to show it is still making progress."""
+
+    def __init__(self, interval: float = 10.0):
+        self.interval = interval
+        self._last = None
+
+    def beat(self, info: str = "") -> None:
+        now = time.monotonic()
+        if self._last is None or now - self._last >= self.interval:
+            print(f"{HEARTBEAT_PREFIX} {info}".rstrip(), flush=True)
+            self._last = now
+
+
+class ManagedProcess:
+    """A script that is kept running.
+
+    Its output is read without blocking whenever the supervisor sees data, so a chatty
+    child can never fill the pipe and stall. With heartbeat_timeout set, a child that has
+    not printed a heartbeat for that long (or within startup_grace of starting) is killed.
+    A child that exits or is killed is restarted after a backoff that doubles each time
+    it dies within stable_seconds, from min_backoff up to max_backoff.
+    """
+
+    def __init__(self, name: str, script: str, heartbeat_timeout: float | None = None,
+                 startup_grace: float = 120.0, min_backoff: float = 1.0, max_backoff: float = 60.0,
+                 stable_seconds: float = 300.0):
+        self.name = name
+        self.script = script
+        self.heartbeat_timeout = heartbeat_timeout
+        self.startup_grace = startup_grace
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_seconds = stable_seconds
+        self.backoff = min_backoff
+        self.process = None
+        self.restarts = 0
+        self._started = None
+        self._last_heartbeat = None
+        self._partial = b""
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self) -> None:
+        # -u: unbuffered, so output and heartbeats arrive as they are printed
+        self.process = subprocess.Popen([sys.executable, "-u", self.script],
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        os.set_blocking(self.process.stdout.fileno(), False)
+        self._started = time.monotonic()
+        self._last_heartbeat = None
+        self._partial = b""
+        logging.info(f"Started {self.name} (pid {self.process.pid}).")
+
+    def drain(self) -> bool:
+        """Read one chunk of pending output; False once the child has closed its output (exited).
+
+        One chunk per call, so a child that never stops writing cannot hold up the loop.
+        """
+        try:
+            data = self.process.stdout.read(READ_CHUNK)
+        except BlockingIOError:
+            return True
+        if data is None:
+            return True
+        if not data:
+            self._emit(self._partial)
+            self._partial = b""
+            return False
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._emit(line)
+        return True
+
+    def _emit(self, line: bytes) -> None:
+        text = line.decode(errors="replace").rstrip()
+        if not text:
+            return
+        if text.startswith(HEARTBEAT_PREFIX):
+            self._last_heartbeat = time.monotonic()
+        else:
+            logging.info(f"[{self.name}] {text}")
+
+    def hung(self, now: float) -> bool:
+        if self.heartbeat_timeout is None or not self.running:
+            return False
+        if self._last_heartbeat is None:
+            return now - self._started > self.startup_grace
+        return now - self._last_heartbeat > self.heartbeat_timeout
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if not self.running:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def next_backoff(self, now: float) -> float:
+        """Delay before restarting, doubling while the child keeps dying soon after starting."""
+        if now - self._started >= self.stable_seconds:
+            self.backoff = self.min_backoff
+        delay = self.backoff
+        self.backoff = min(self.max_backoff, self.backoff * 2)
+        return delay
+
+
+class Supervisor:
+    """Event loop over child output, a watchdog and timers."""
+
+    def __init__(self, watchdog_seconds: float = 1.0):
+        self.selector = selectors.DefaultSelector()
+        self.watchdog_seconds = watchdog_seconds
+        self.processes = []
+        self._timers = []  # heap of (when, sequence, callback)
+        self._sequence = 0
+        self._timer_lock = threading.Lock()  # background jobs may schedule timers too
+        self._loop_thread = None
+        # Self-pipe: a timer scheduled from another thread wakes the loop out of select()
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        self.selector.register(self._wake_read, selectors.EVENT_READ, None)
+        self._running = False
+
+    def add_process(self, managed: ManagedProcess, start: bool = True) -> ManagedProcess:
+        self.processes.append(managed)
+        if start:
+            self._start(managed)
+        return managed
+
+    def _start(self, managed: ManagedProcess) -> None:
+        managed.start()
+        self.selector.register(managed.process.stdout, selectors.EVENT_READ, managed)
+
+    def call_at(self, when: float, callback) -> None:
+        """Run callback at monotonic time when."""
+        with self._timer_lock:
+            heapq.heappush(self._timers, (when, self._sequence, callback))
+            self._sequence += 1
+        if threading.get_ident() != self._loop_thread:
+            try:
+                os.write(self._wake_write, b"\0")
+            except BlockingIOError:
+                pass  # pipe full: the loop has a wake-up pending already
+
+    def _next_timeout(self, now: float) -> float:
+        with self._timer_lock:
+            if not self._timers:
+                return self.watchdog_seconds
+            return max(0.0, min(self.watchdog_seconds, self._timers[0][0] - now))
+
+    def _pop_due(self):
+        with self._timer_lock:
+            if self._timers and self._timers[0][0] <= time.monotonic():
+                return heapq.heappop(self._timers)[2]
+        return None
+
+    def call_later(self, delay: float, callback) -> None:
+        self.call_at(time.monotonic() + delay, callback)
+
+    def call_every(self, interval: float, callback, first: float | None = None) -> None:
+        def repeat():
+            self.call_later(interval, repeat)
+            callback()
+        self.call_later(interval if first is None else first, repeat)
+
+    def call_at_hours(self, hours: list, callback) -> None:
+        """Run callback at the start of each of the given hours of the day, every day."""
+        def seconds_to_next() -> float:
+            now = datetime.now()
+            today = now.replace(minute=0, second=0, microsecond=0)
+            times = [today.replace(hour=h) + timedelta(days=d) for d in (0, 1) for h in sorted(hours)]
+            return min(t for t in times if t > now).timestamp() - now.timestamp()
+
+        def fire():
+            self.call_later(seconds_to_next(), fire)
+            callback()
+        self.call_later(seconds_to_next(), fire)
+
+    @staticmethod
+    def in_background(job, name: str):
+        """Wrap a blocking job so each call runs it on a thread, skipping calls while it still runs."""
+        lock = threading.Lock()
+
+        def run():
+            try:
+                job()
+            except Exception:
+                logging.exception(f"{name} failed.")
+            finally:
+                lock.release()
+
+        def start():
+            if lock.acquire(blocking=False):
+                threading.Thread(target=run, name=name, daemon=True).start()
+            else:
+                logging.info(f"{name} still running; skipped.")
+        return start
+
+    def _exited(self, managed: ManagedProcess, reason: str) -> None:
+        self.selector.unregister(managed.process.stdout)
+        managed.stop()
+        managed.process.stdout.close()
+        delay = managed.next_backoff(time.monotonic())
+        logging.warning(f"{managed.name} {reason}. Restarting in {delay:.0f}s.")
+        managed.restarts += 1
+        self.call_later(delay, lambda: self._start(managed))
+
+    def run(self) -> None:
+        self._running = True
+        self._loop_thread = threading.get_ident()
+        try:
+            while self._running:
+                for key, _ in self.selector.select(self._next_timeout(time.monotonic())):
+                    managed = key.data
+                    if managed is None:
+                        os.read(self._wake_read, READ_CHUNK)
+                        continue
+                    if not managed.drain():
+                        managed.process.wait()
+                        self._exited(managed, f"exited with code {managed.process.returncode}")
+
+                now = time.monotonic()
+                for managed in self.processes:
+                    if managed.hung(now):
+                        self._exited(managed, "stopped sending heartbeats")
+
+                while (callback := self._pop_due()) is not None:
+                    callback()
+        finally:
+            self.shutdown()
+
+    def stop(self) -> None:
+        self._running = False
+
+    def shutdown(self) -> None:
+        for managed in reversed(self.processes):
+            managed.stop()
@@ -0,0 +1,203 @@
+import os
+import sys
+import resource
+import multiprocessing
+import time
+import cv2
+import yaml
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.dirname(__file__))
+from sort import Sort  # noqa: E402
+from counting import CountingState  # noqa: E402
+from detectors import create_detector  # noqa: E402
+from eval_detections import IMAGE_SUFFIXES, load_yolo_split  # noqa: E402
+
+# Configuration
+MODEL_PATH = "models/yolo11n.pt"
+EXPORT_DIR = "models/sweep"
+SOURCE = "test_video/test.mov"  # a video file or a folder of images
+IMGSZ_LIST = [640, 480, 416, 320]
+FORMATS = ["ncnn", "onnx"]  # add "ncnn_int8" once the ncnn tools are built (see export_ncnn_int8.py)
+THREAD_COUNTS = [2, 4]
+FRAME_SKIP = 2
+MAX_FRAMES = 600  # frames sent to inference per configuration
+GROUND_TRUTH_PATH = "test_video/test_counts.yaml"  # {class: true count}; without it the first config is the reference
+ACCURACY_BAR = 0.95
+REPORT_PATH = "models/sweep/benchmark.md"
+
+with open("src/config.yaml", "r") as f:
+    config = yaml.safe_load(f)
+with open("src/classes.yaml", "r") as f:
+    CLASSES = yaml.safe_load(f)
+
+
+def export_model(fmt: str, imgsz: int) -> tuple[str, str | None]:
+    """Export (or reuse) the model in one format and size; returns (detector backend, model path).
+
+    Exports go to EXPORT_DIR only; the deployed models next to MODEL_PATH are never touched.
+    The path is None if the export failed.
+    """
+    from export_to_ncnn import export_name, export_to_ncnn
+
+    name = export_name(MODEL_PATH, imgsz)
+    if fmt == "onnx":
+        from export_to_onnx import export_to_onnx
+
+        path = os.path.join(EXPORT_DIR, f"{name}.onnx")
+        return "onnx", path if os.path.exists(path) else export_to_onnx(MODEL_PATH, EXPORT_DIR, imgsz)
+
+    path = os.path.join(EXPORT_DIR, f"{name}_ncnn_model")
+    if not os.path.exists(path):
+        path = export_to_ncnn(MODEL_PATH, EXPORT_DIR, imgsz)
+    if fmt == "ncnn_int8":
+        from export_ncnn_int8 import CALIBRATION_IMAGES, DATASET_DIR, quantize_ncnn
+
+        int8_path = path.replace("_ncnn_model", "_ncnn_int8_model")
+        if not os.path.exists(int8_path):
+            calibration, _ = load_yolo_split(DATASET_DIR, "train", limit=CALIBRATION_IMAGES)
+            quantize_ncnn(path, int8_path, calibration)
+        path = int8_path
+    return "ncnn", path
+
+
+def read_frames(source: str):
+    """Frames sent to inference: every FRAME_SKIP-th video frame, or each image of a folder."""
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_SUFFIXES))
+        for name in names[:MAX_FRAMES]:
+            yield cv2.imread(os.path.join(source, name))
+        return
+    cap = cv2.VideoCapture(source)
+    index = sent = 0
+    while sent < MAX_FRAMES:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % FRAME_SKIP == 0:
+            sent += 1
+            yield frame
+        index += 1
+    cap.release()
+
+
+def run_config(backend: str, model_path: str, num_threads: int, source: str) -> dict:
+    """Time the per-frame path (preprocess, infer, decode, track, count) for one configuration.
+
+    Runs in its own process so peak RSS belongs to this configuration alone.
+    """
+    detector = create_detector(backend, model_path, CLASSES,
+                               conf_threshold=config['track_low_threshold'], num_threads=num_threads)
+    tracker = Sort(solver=config['association_solver'], high_threshold=config['confidence_threshold'],
+                   low_threshold=config['track_low_threshold'])
+    state = CountingState(detector.classes)
+    latencies = []
+    for frame in read_frames(source):
+        start = time.perf_counter()
+        tracked = tracker.update(detector.detect(frame), dt=FRAME_SKIP)
+        state.retire(tracker.removed_ids)
+        state.observe(tracked)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "frames": len(latencies),
+        "counts": state.counts,
+    }
+
+
+def count_accuracy(counts: dict, truth: dict) -> float:
+    """1 - (sum of per-class count errors / true total), floored at 0."""
+    total = sum(truth.values())
+    if total == 0:
+        return 1.0 if not any(counts.values()) else 0.0
+    error = sum(abs(counts.get(cls, 0) - n) for cls, n in truth.items())
+    return max(0.0, 1 - error / total)
+
+
+def pareto_front(rows: list) -> set:
+    """Indices of configurations that no other configuration beats on both p50 latency and accuracy."""
+    front = set()
+    for i, a in enumerate(rows):
+        dominated = any(
+            b["p50_ms"] <= a["p50_ms"] and b["accuracy"] >= a["accuracy"]
+            and (b["p50_ms"] < a["p50_ms"] or b["accuracy"] > a["accuracy"])
+            for j, b in enumerate(rows) if j != i
+        )
+        if not dominated:
+            front.add(i)
+    return front
+
+
+def write_report(rows: list, path: str, reference: str) -> None:
+    front = pareto_front(rows)
+    eligible = [i for i, row in enumerate(rows) if row["accuracy"] >= ACCURACY_BAR]
+    best = min(eligible, key=lambda i: rows[i]["p50_ms"]) if eligible else None
+
+    lines = [
+        "| format | imgsz | threads | p50 ms | p95 ms | peak RSS MB | accuracy | pareto |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for i in sorted(range(len(rows)), key=lambda i: rows[i]["p50_ms"]):
+        row = rows[i]
+        mark = "✅ best" if i == best else ("yes" if i in front else "")
+        lines.append(f"| {row['format']} | {row['imgsz']} | {row['threads']} | {row['p50_ms']:.1f} | "
+                     f"{row['p95_ms']:.1f} | {row['peak_rss_mb']:.0f} | {row['accuracy']:.3f} | {mark} |")
+    table = "\n".join(lines) + "\n"
+
+    with open(path, "w") as f:
+        f.write(f"# Export sweep on {SOURCE} ({rows[0]['frames']} frames, frame skip {FRAME_SKIP})\n\n")
+        f.write(f"Counting accuracy against {reference}; accuracy bar {ACCURACY_BAR}.\n\n{table}")
+    print(table)
+    if best is None:
+        print(f"[WARNING] No configuration reaches the accuracy bar of {ACCURACY_BAR}")
+    else:
+        row = rows[best]
+        print(f"[INFO] Fastest configuration meeting the bar: {row['format']} imgsz {row['imgsz']} "
+              f"with {row['threads']} threads ({row['p50_ms']:.1f} ms p50)")
+    print(f"[INFO] Report written to {path}")
+
+
+def main() -> None:
+    if not os.path.exists(SOURCE):
+        raise FileNotFoundError(f"Benchmark source not found: {SOURCE}")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    truth, reference = None, GROUND_TRUTH_PATH
+    if os.path.exists(GROUND_TRUTH_PATH):
+        with open(GROUND_TRUTH_PATH, "r") as f:
+            truth = yaml.safe_load(f)
+
+    rows = []
+    context = multiprocessing.get_context("spawn")
+    for fmt in FORMATS:
+        for imgsz in IMGSZ_LIST:
+            try:
+                backend, model_path = export_model(fmt, imgsz)
+            except Exception as e:
+                print(f"[WARNING] Skipping {fmt} imgsz {imgsz}: export failed ({e})")
+                continue
+            if model_path is None:
+                print(f"[WARNING] Skipping {fmt} imgsz {imgsz}: export failed")
+                continue
+            for threads in THREAD_COUNTS:
+                print(f"[INFO] Benchmarking {fmt} imgsz {imgsz} with {threads} threads...")
+                with context.Pool(1) as pool:
+                    result = pool.apply(run_config, (backend, model_path, threads, SOURCE))
+                if truth is None:
+                    truth, reference = result["counts"], f"{fmt} imgsz {imgsz} (no ground truth file)"
+                rows.append({"format": fmt, "imgsz": imgsz, "threads": threads, **result})
+
+    if not rows:
+        print("[ERROR] No configuration could be exported; nothing to report.")
+        return
+    for row in rows:
+        row["accuracy"] = count_accuracy(row["counts"], truth)
+    write_report(rows, REPORT_PATH, reference)
+    print("[✅] Benchmark complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import sort  # noqa: E402
+from sort import SOLVERS, Sort, associate_detections_to_trackers, iou_batch  # noqa: E402
+
+# Configuration
+OBJECT_COUNTS = [5, 10, 20, 40, 80]
+FRAMES = 200
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+SEED = 0
+# Component split: object counts, and frame scales (1 = dense, 4 = sparse scene)
+SPLIT_OBJECT_COUNTS = [20, 80, 160, 320, 640, 1280]
+SPLIT_SCALES = [1, 4]
+
+
+def make_scene(n: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Random boxes and per-frame velocities for n objects."""
+    xy = rng.uniform([0, 0], [FRAME_WIDTH - 60, FRAME_HEIGHT - 120], size=(n, 2))
+    wh = rng.uniform([15, 30], [60, 120], size=(n, 2))
+    boxes = np.hstack((xy, xy + wh))
+    velocity = rng.uniform(-4, 4, size=(n, 2))
+    return boxes, velocity
+
+
+def frame_detections(boxes: np.ndarray, velocity: np.ndarray, frame: int, rng: np.random.Generator) -> np.ndarray:
+    """Detections for one frame with a little jitter and a confidence column."""
+    shift = np.tile(velocity * frame, 2)
+    dets = boxes + shift + rng.normal(0, 1.0, size=boxes.shape)
+    conf = rng.uniform(0.5, 1.0, size=(len(boxes), 1))
+    return np.hstack((dets, conf))
+
+
+def bench_association(n: int, rng: np.random.Generator, solver: str) -> float:
+    """Mean milliseconds for one association call with n detections and n tracks."""
+    boxes, velocity = make_scene(n, rng)
+    dets = frame_detections(boxes, velocity, 1, rng)
+    trks = frame_detections(boxes, velocity, 0, rng)[:, :4]
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        associate_detections_to_trackers(dets, trks, solver=solver)
+    return (time.perf_counter() - start) * 1000 / FRAMES
+
+
+def bench_tracker(n: int, rng: np.random.Generator, solver: str) -> float:
+    """Mean milliseconds for one Sort.update call with n objects in the scene."""
+    boxes, velocity = make_scene(n, rng)
+    frames = [frame_detections(boxes, velocity, f, rng) for f in range(FRAMES)]
+    tracker = Sort(solver=solver)
+    start = time.perf_counter()
+    for dets in frames:
+        tracker.update(dets)
+    return (time.perf_counter() - start) * 1000 / FRAMES
+
+
+def bench_split(n: int, scale: int, rng: np.random.Generator, split: bool) -> float:
+    """Mean milliseconds for one Hungarian solve, with or without the component split."""
+    global FRAME_WIDTH, FRAME_HEIGHT
+    FRAME_WIDTH, FRAME_HEIGHT = 640 * scale, 480 * scale
+    boxes, velocity = make_scene(n, rng)
+    FRAME_WIDTH, FRAME_HEIGHT = 640, 480
+    iou_matrix = iou_batch(frame_detections(boxes, velocity, 1, rng), frame_detections(boxes, velocity, 0, rng))
+    saved = sort.COMPONENT_SPLIT_SIZE
+    sort.COMPONENT_SPLIT_SIZE = 0 if split else sys.maxsize
+    try:
+        reps = max(5, 4000 // n)
+        start = time.perf_counter()
+        for _ in range(reps):
+            sort.solve_hungarian(iou_matrix, 0.3)
+        return (time.perf_counter() - start) * 1000 / reps
+    finally:
+        sort.COMPONENT_SPLIT_SIZE = saved
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(SEED)
+    print(f"{'solver':>10} {'objects':>8} {'associate ms':>13} {'Sort.update ms':>15}")
+    for solver in SOLVERS:
+        for n in OBJECT_COUNTS:
+            assoc_ms = bench_association(n, rng, solver)
+            update_ms = bench_tracker(n, rng, solver)
+            print(f"{solver:>10} {n:>8} {assoc_ms:>13.3f} {update_ms:>15.3f}")
+
+    print(f"\n{'scene':>6} {'objects':>8} {'one solve ms':>13} {'components ms':>14}")
+    for scale in SPLIT_SCALES:
+        for n in SPLIT_OBJECT_COUNTS:
+            print(f"{scale:>5}x {n:>8} {bench_split(n, scale, rng, False):>13.3f} {bench_split(n, scale, rng, True):>14.3f}")
@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import cv2
+import yaml
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from sort import iou_batch  # noqa: E402
+
+# COCO-style IoU thresholds for mAP50-95
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_yolo_split(dataset_dir: str, split: str, limit: int | None = None) -> tuple[list, list]:
+    """Image paths of a YOLO dataset split and the class names from its data.yaml."""
+    with open(os.path.join(dataset_dir, "data.yaml"), "r") as f:
+        names = yaml.safe_load(f)["names"]
+    if isinstance(names, dict):
+        names = [names[i] for i in sorted(names)]
+    image_dir = os.path.join(dataset_dir, "images", split)
+    images = sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir)
+                    if name.lower().endswith(IMAGE_SUFFIXES))
+    return images[:limit], names
+
+
+def read_labels(image_path: str, width: int, height: int) -> np.ndarray:
+    """Ground truth for one image as N x 5 [x1, y1, x2, y2, cls] pixels, from its YOLO label file."""
+    label_path = os.path.splitext(image_path.replace(f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"))[0] + ".txt"
+    if not os.path.exists(label_path):
+        return np.empty((0, 5), dtype=np.float32)
+    rows = np.loadtxt(label_path, ndmin=2, dtype=np.float32)
+    if rows.size == 0:
+        return np.empty((0, 5), dtype=np.float32)
+    cls, cx, cy, w, h = rows[:, :5].T
+    return np.stack(((cx - w / 2) * width, (cy - h / 2) * height,
+                     (cx + w / 2) * width, (cy + h / 2) * height, cls), axis=1)
+
+
+def shared_classes(model_names: dict, dataset_names: list) -> dict:
+    """Model class id -> dataset class id for every class name both have."""
+    dataset_ids = {name: i for i, name in enumerate(dataset_names)}
+    return {int(i): dataset_ids[name] for i, name in model_names.items() if name in dataset_ids}
+
+
+def match_detections(dets: np.ndarray, gts: np.ndarray) -> np.ndarray:
+    """True positive flags (N x thresholds) for one image's detections, matched per class by confidence."""
+    tp = np.zeros((len(dets), len(IOU_THRESHOLDS)), dtype=bool)
+    if len(dets) == 0 or len(gts) == 0:
+        return tp
+    ious = iou_batch(dets, gts)
+    ious[dets[:, 5][:, None] != gts[:, 4][None, :]] = 0
+    order = np.argsort(-dets[:, 4], kind="stable")
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        taken = np.zeros(len(gts), dtype=bool)
+        for i in order:
+            candidates = np.where(taken, 0, ious[i])
+            j = candidates.argmax()
+            if candidates[j] >= threshold:
+                taken[j] = True
+                tp[i, t] = True
+    return tp
+
+
+def average_precision(tp: np.ndarray, conf: np.ndarray, n_gt: int) -> np.ndarray:
+    """101-point interpolated AP at each IoU threshold for one class."""
+    if n_gt == 0 or len(tp) == 0:
+        return np.zeros(len(IOU_THRESHOLDS))
+    tp = tp[np.argsort(-conf, kind="stable")]
+    tps = np.cumsum(tp, axis=0)
+    fps = np.cumsum(~tp, axis=0)
+    recall = tps / n_gt
+    precision = tps / (tps + fps)
+    precision = np.maximum.accumulate(precision[::-1], axis=0)[::-1]
+    points = np.linspace(0, 1, 101)
+    ap = np.empty(tp.shape[1])
+    for t in range(tp.shape[1]):
+        idx = np.searchsorted(recall[:, t], points, side="left")
+        ap[t] = np.where(idx < len(precision), precision[np.minimum(idx, len(precision) - 1), t], 0).mean()
+    return ap
+
+
+def evaluate_detector(detector, images: list, class_map: dict) -> dict:
+    """mAP50, mAP50-95 and per-image detector latency over a list of labelled images.
+
+    class_map maps the detector's class ids to dataset class ids; other classes are ignored.
+    """
+    per_class = {c: {"tp": [], "conf": [], "n_gt": 0} for c in set(class_map.values())}
+    lookup = np.full(max(class_map) + 1, -1, dtype=np.float32)
+    lookup[list(class_map)] = list(class_map.values())
+    dataset_ids = np.array(list(per_class), dtype=np.float32)
+    latencies = np.empty(len(images))
+
+    for k, path in enumerate(images):
+        frame = cv2.imread(path)
+        start = time.perf_counter()
+        dets = detector.detect(frame)
+        latencies[k] = time.perf_counter() - start
+
+        dets = dets[dets[:, 5] < len(lookup)].copy()
+        dets[:, 5] = lookup[dets[:, 5].astype(np.int64)]
+        dets = dets[dets[:, 5] >= 0]
+        gts = read_labels(path, frame.shape[1], frame.shape[0])
+        gts = gts[np.isin(gts[:, 4], dataset_ids)]
+        tp = match_detections(dets, gts)
+        for c, stats in per_class.items():
+            mask = dets[:, 5] == c
+            stats["tp"].append(tp[mask])
+            stats["conf"].append(dets[mask, 4])
+            stats["n_gt"] += int(np.sum(gts[:, 4] == c))
+
+    aps = np.array([
+        average_precision(np.concatenate(s["tp"]), np.concatenate(s["conf"]), s["n_gt"])
+        for s in per_class.values() if s["n_gt"] > 0
+    ]).reshape(-1, len(IOU_THRESHOLDS))
+    return {
+        "map50": float(aps[:, 0].mean()) if len(aps) else 0.0,
+        "map50_95": float(aps.mean()) if len(aps) else 0.0,
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000) if len(images) else 0.0,
+        "latency_p95_ms": float(np.percentile(latencies, 95) * 1000) if len(images) else 0.0,
+        "images": len(images),
+    }
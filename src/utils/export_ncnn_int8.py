@@ -0,0 +1,128 @@
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.dirname(__file__))
+from detectors import Letterbox, create_detector, read_metadata  # noqa: E402
+from eval_detections import evaluate_detector, load_yolo_split, shared_classes  # noqa: E402
+from export_to_ncnn import export_to_ncnn  # noqa: E402
+
+# Configuration
+MODEL_PATH = "models/yolo11n.pt"
+EXPORT_DIR = "models"
+DATASET_DIR = os.path.expanduser("~/datasets/cyclist_yolo11")  # output of coco_to_cyclist.py
+IMGSZ_LIST = [640, 480, 320]
+CALIBRATION_IMAGES = 200  # from the train split
+EVAL_IMAGES = 500  # from the test split
+NUM_THREADS = 4
+CONF_THRESHOLD = 0.01  # low, so the precision/recall curve is complete
+REPORT_PATH = "models/int8_report.md"
+
+# ncnn command-line tools, built from the ncnn sources with NCNN_BUILD_TOOLS=ON
+NCNN_TOOLS = ("ncnnoptimize", "ncnn2table", "ncnn2int8")
+
+
+def check_tools() -> None:
+    missing = [tool for tool in NCNN_TOOLS if shutil.which(tool) is None]
+    if missing:
+        raise FileNotFoundError(
+            f"ncnn tools not on PATH: {', '.join(missing)}. Build ncnn with -DNCNN_BUILD_TOOLS=ON."
+        )
+
+
+def write_calibration_set(images: list, imgsz: int, work_dir: str) -> str:
+    """Letterbox calibration images exactly as NcnnDetector does and list them for ncnn2table."""
+    letterbox = Letterbox(imgsz)
+    paths = []
+    for i, path in enumerate(images):
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        out_path = os.path.join(work_dir, f"calib_{i:05d}.png")
+        cv2.imwrite(out_path, letterbox(frame))
+        paths.append(out_path)
+    list_path = os.path.join(work_dir, "images.txt")
+    with open(list_path, "w") as f:
+        f.write("\n".join(paths) + "\n")
+    return list_path
+
+
+def quantize_ncnn(fp32_dir: str, int8_dir: str, calibration_images: list) -> str:
+    """Build an INT8 copy of an NCNN model folder, calibrated with KL divergence on the given images."""
+    imgsz = int(read_metadata(fp32_dir)["imgsz"][0])
+    print(f"[INFO] Quantizing {fp32_dir} to INT8 with {len(calibration_images)} calibration images...")
+    os.makedirs(int8_dir, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        opt_param = os.path.join(work_dir, "model-opt.param")
+        opt_bin = os.path.join(work_dir, "model-opt.bin")
+        table = os.path.join(work_dir, "model.table")
+        list_path = write_calibration_set(calibration_images, imgsz, work_dir)
+        norm = ",".join(["0.003921569"] * 3)
+
+        subprocess.run(["ncnnoptimize", os.path.join(fp32_dir, "model.ncnn.param"),
+                        os.path.join(fp32_dir, "model.ncnn.bin"), opt_param, opt_bin, "0"], check=True)
+        subprocess.run(["ncnn2table", opt_param, opt_bin, list_path, table,
+                        "mean=[0,0,0]", f"norm=[{norm}]", f"shape=[{imgsz},{imgsz},3]",
+                        "pixel=RGB", f"thread={NUM_THREADS}", "method=kl"], check=True)
+        subprocess.run(["ncnn2int8", opt_param, opt_bin, os.path.join(int8_dir, "model.ncnn.param"),
+                        os.path.join(int8_dir, "model.ncnn.bin"), table], check=True)
+
+    shutil.copy(os.path.join(fp32_dir, "metadata.yaml"), os.path.join(int8_dir, "metadata.yaml"))
+    print(f"[INFO] Saved INT8 model to {int8_dir}")
+    return int8_dir
+
+
+def evaluate_model(model_dir: str, images: list, dataset_names: list) -> dict:
+    names = read_metadata(model_dir)["names"]
+    class_map = shared_classes(names, dataset_names)
+    detector = create_detector("ncnn", model_dir, {i: names[i] for i in class_map},
+                               conf_threshold=CONF_THRESHOLD, num_threads=NUM_THREADS)
+    return evaluate_detector(detector, images, class_map)
+
+
+def write_report(rows: list, path: str) -> None:
+    """Markdown table of accuracy and latency, with INT8 compared to FP32 at the same imgsz."""
+    fp32 = {row["imgsz"]: row for row in rows if row["precision"] == "fp32"}
+    lines = [
+        "| imgsz | precision | mAP50 | mAP50-95 | ΔmAP50-95 | p50 ms | p95 ms | speedup |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for row in rows:
+        base = fp32[row["imgsz"]]
+        delta = row["map50_95"] - base["map50_95"]
+        speedup = base["latency_p50_ms"] / row["latency_p50_ms"] if row["latency_p50_ms"] else float("nan")
+        lines.append(f"| {row['imgsz']} | {row['precision']} | {row['map50']:.3f} | {row['map50_95']:.3f} | "
+                     f"{delta:+.3f} | {row['latency_p50_ms']:.1f} | {row['latency_p95_ms']:.1f} | {speedup:.2f}x |")
+    report = "\n".join(lines) + "\n"
+    with open(path, "w") as f:
+        f.write(f"# INT8 vs FP32 NCNN ({rows[0]['images']} test images, {NUM_THREADS} threads)\n\n{report}")
+    print(report)
+    print(f"[INFO] Report written to {path}")
+
+
+def main() -> None:
+    check_tools()
+    calibration, _ = load_yolo_split(DATASET_DIR, "train")
+    rng = np.random.default_rng(0)
+    calibration = list(rng.choice(calibration, size=min(CALIBRATION_IMAGES, len(calibration)), replace=False))
+    test_images, dataset_names = load_yolo_split(DATASET_DIR, "test", limit=EVAL_IMAGES)
+
+    rows = []
+    for imgsz in IMGSZ_LIST:
+        fp32_dir = export_to_ncnn(MODEL_PATH, EXPORT_DIR, imgsz=imgsz)
+        int8_dir = quantize_ncnn(fp32_dir, fp32_dir.replace("_ncnn_model", "_ncnn_int8_model"), calibration)
+        for precision, model_dir in (("fp32", fp32_dir), ("int8", int8_dir)):
+            rows.append({"imgsz": imgsz, "precision": precision, **evaluate_model(model_dir, test_images, dataset_names)})
+
+    write_report(rows, REPORT_PATH)
+    print("[✅] INT8 export complete.")
+
+
+if __name__ == "__main__":
+    main()
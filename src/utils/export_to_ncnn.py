@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 from ultralytics import YOLO
 
 # Configuration
@@ -6,31 +8,64 @@ MODEL_PATH = "models/yolo11n.pt"
 EXPORT_DIR = "models"
 
 
-def export_to_ncnn(model_path: str, export_dir: str) -> None:
-    """Export a YOLOv8 model to NCNN format and move it to the export directory."""
-    print(f"[INFO] Exporting {model_path} to NCNN format...")
+def export_name(model_path: str, imgsz: int = 640, classes: list | None = None) -> str:
+    """Base name shared by the NCNN and ONNX exports of a model: <model>[_<n>cls][_<imgsz>].
 
-    # Load the YOLOv8 model
-    model = YOLO(model_path)
+    The size is left out at 640 so the default exports keep the names config.yaml expects.
+    """
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    if classes is not None:
+        name += f"_{len(classes)}cls"
+    return name if imgsz == 640 else f"{name}_{imgsz}"
 
-    # Export to NCNN format
-    model.export(format="ncnn", imgsz=640, device="cpu")
 
-    # Move output files (.param and .bin) to export directory
-    base_name = os.path.splitext(os.path.basename(model_path))[0]
-    param_file = f"{base_name}.param"
-    bin_file = f"{base_name}.bin"
+def load_isolated(model_path: str, work_dir: str):
+    """Load a copy of the weights placed in work_dir.
 
-    for filename in [param_file, bin_file]:
-        if os.path.exists(filename):
-            dest_path = os.path.join(export_dir, filename)
-            os.replace(filename, dest_path)
-            print(f"[INFO] Saved {filename} to {dest_path}")
-        else:
-            print(f"[ERROR] Export failed. File not found: {filename}")
+    Ultralytics writes an export next to the .pt it was loaded from, which for
+    models/yolo11n.pt is the deployed models/yolo11n_ncnn_model. Exporting from a copy keeps
+    that folder untouched unless it is the destination.
+    """
+    work_path = os.path.join(work_dir, os.path.basename(model_path))
+    if os.path.exists(model_path):
+        shutil.copy(model_path, work_path)
+    else:
+        # e.g. "yolo11n.pt" on a fresh install: let Ultralytics download it, then save a copy
+        YOLO(model_path).save(work_path)
+    return YOLO(work_path)
 
-    print("[✅] NCNN export complete.")
 
+def export_to_ncnn(model_path: str, export_dir: str, imgsz: int = 640, classes: list | None = None) -> str:
+    """Export a YOLO model to an NCNN model folder in the export directory and return its path.
+
+    The folder is named <export_name>_ncnn_model (see export_name); the size is in the name
+    since an NCNN export only runs at the input size it was exported with. With classes, the
+    detection head is pruned to those class names first (see prune_head.py).
+    """
+    print(f"[INFO] Exporting {model_path} to NCNN format at imgsz {imgsz}...")
+
+    dest_path = os.path.join(export_dir, f"{export_name(model_path, imgsz, classes)}_ncnn_model")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Load a copy of the YOLO model, so the export lands in work_dir
+        model = load_isolated(model_path, work_dir)
+
+        # Optionally cut the classification head down to the counted classes
+        if classes is not None:
+            from prune_head import prune_detect_head
+
+            prune_detect_head(model, classes)
+
+        # Export to NCNN format (a folder with model.ncnn.param, model.ncnn.bin and metadata.yaml)
+        export_path = model.export(format="ncnn", imgsz=imgsz, device="cpu")
+
+        if os.path.exists(dest_path):
+            shutil.rmtree(dest_path)
+        shutil.move(export_path, dest_path)
+    print(f"[INFO] Saved NCNN model to {dest_path}")
+
+    print("[✅] NCNN export complete.")
+    return dest_path
 
 if __name__ == "__main__":
     os.makedirs(EXPORT_DIR, exist_ok=True)
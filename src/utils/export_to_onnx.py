@@ -1,39 +1,52 @@
 import os
-from ultralytics import YOLO
+import shutil
+import tempfile
+from export_to_ncnn import export_name, load_isolated
 
 # Configuration
 MODEL_PATH = "models/yolo11n.pt"
 EXPORT_DIR = "models"
 
 
-def export_to_onnx(model_path: str, export_dir: str, imgsz: int = 640) -> None:
-    """Exports a YOLOv8 model to ONNX format and saves it to the export directory."""
+def export_to_onnx(model_path: str, export_dir: str, imgsz: int = 640, classes: list | None = None) -> str | None:
+    """Exports a YOLOv8 model to ONNX format, saves it to the export directory and returns its path.
+
+    The file is named <export_name>.onnx, with the same name as the NCNN export (see
+    export_name), since the export has a fixed input size. With classes, the detection head
+    is pruned to those class names first (see prune_head.py).
+    """
     print(f"[INFO] Exporting model from {model_path} to ONNX format...")
 
-    # Load YOLO model
-    model = YOLO(model_path)
-
-    # Export to ONNX
-    model.export(
-        format="onnx",
-        imgsz=imgsz,
-        simplify=True,
-        dynamic=False,
-        device="cpu"
-    )
-
-    # Move exported file to the export directory
-    base_name = os.path.splitext(os.path.basename(model_path))[0]
-    onnx_file = f"{base_name}.onnx"
-    if os.path.exists(onnx_file):
-        dest_path = os.path.join(export_dir, onnx_file)
-        os.replace(onnx_file, dest_path)
-        print(f"[INFO] ONNX model saved to {dest_path}")
-    else:
-        print("[ERROR] Export failed. ONNX file not found.")
+    dest_path = os.path.join(export_dir, f"{export_name(model_path, imgsz, classes)}.onnx")
 
-    print("[✅] Export completed.")
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Load a copy of the YOLO model, so the export lands in work_dir and not on the deployed .onnx
+        model = load_isolated(model_path, work_dir)
+
+        # Optionally cut the classification head down to the counted classes
+        if classes is not None:
+            from prune_head import prune_detect_head
+
+            prune_detect_head(model, classes)
 
+        # Export to ONNX
+        onnx_path = model.export(
+            format="onnx",
+            imgsz=imgsz,
+            simplify=True,
+            dynamic=False,
+            device="cpu"
+        )
+
+        # Move exported file to the export directory
+        if not onnx_path or not os.path.exists(onnx_path):
+            print("[ERROR] Export failed. ONNX file not found.")
+            return None
+        shutil.move(onnx_path, dest_path)
+    print(f"[INFO] ONNX model saved to {dest_path}")
+
+    print("[✅] Export completed.")
+    return dest_path
 
 if __name__ == "__main__":
     os.makedirs(EXPORT_DIR, exist_ok=True)
@@ -0,0 +1,69 @@
+import os
+import yaml
+import torch
+from torch import nn
+
+# Configuration
+CLASSES_PATH = "src/classes.yaml"
+CLASS_SET = "counted"  # "counted" (classes.yaml) or "cyclist"
+# Label map of the fine-tuned cyclist model (custom_model_train/coco_to_cyclist.py YOLO_NAMES)
+CYCLIST_CLASSES = ["person", "cyclist", "car", "motorcycle", "bus", "truck"]
+
+
+def counted_classes(path: str = CLASSES_PATH) -> list:
+    """Names of the classes the counters count, from classes.yaml."""
+    with open(path, "r") as f:
+        return list(yaml.safe_load(f).values())
+
+
+def _prune_conv(conv: nn.Conv2d, keep: torch.Tensor) -> nn.Conv2d:
+    """Copy of a 1x1 classification conv that only produces the kept output channels."""
+    pruned = nn.Conv2d(conv.in_channels, len(keep), conv.kernel_size, conv.stride, conv.padding,
+                       bias=conv.bias is not None).to(conv.weight.device, conv.weight.dtype)
+    pruned.weight.data = conv.weight.data[keep].clone()
+    if conv.bias is not None:
+        pruned.bias.data = conv.bias.data[keep].clone()
+    return pruned
+
+
+def prune_detect_head(model, class_names: list) -> dict:
+    """Cut a YOLO detection head down to the named classes, in place.
+
+    Only the last conv of each classification branch changes: its output channels for the
+    other classes are dropped, so the exported model outputs 4 + len(classes) rows per anchor
+    instead of 4 + 80. The model's names become the kept classes, renumbered from 0 in their
+    original order, and exports carry that map in their metadata. Returns the new names.
+    """
+    net = model.model
+    head = net.model[-1]
+    names = {int(i): name for i, name in net.names.items()}
+    keep = [i for i, name in names.items() if name in class_names]
+    missing = [name for name in class_names if name not in names.values()]
+    if missing:
+        print(f"[WARNING] Model has no class {missing}; skipped.")
+    if not keep:
+        raise ValueError(f"None of {class_names} are classes of this model")
+
+    index = torch.tensor(keep, dtype=torch.long)
+    branches = [head.cv3] + ([head.one2one_cv3] if getattr(head, "one2one_cv3", None) is not None else [])
+    for branch in branches:
+        for seq in branch:
+            seq[-1] = _prune_conv(seq[-1], index)
+
+    head.nc = len(keep)
+    head.no = head.nc + head.reg_max * 4
+    net.nc = head.nc
+    net.yaml["nc"] = head.nc
+    net.names = {new: names[old] for new, old in enumerate(keep)}
+    print(f"[INFO] Pruned detection head from {len(names)} to {head.nc} classes: {list(net.names.values())}")
+    return net.names
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.path.append(os.path.dirname(__file__))
+    from export_to_ncnn import MODEL_PATH, EXPORT_DIR, export_to_ncnn
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    export_to_ncnn(MODEL_PATH, EXPORT_DIR, classes=counted_classes() if CLASS_SET == "counted" else CYCLIST_CLASSES)
@@ -0,0 +1,5 @@
+# conftest.py - Make the flat src/ modules importable, as the counters do
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
@@ -0,0 +1,65 @@
+import tracemalloc
+import numpy as np
+
+from counting import CountingState
+from sort import Sort
+from utils.soak_counting import synthetic_detections
+
+CLASSES = {1: "bicycle", 2: "car"}
+
+
+def row(obj_id, cls_id):
+    return [0, 0, 10, 10, obj_id, cls_id, 0.9]
+
+
+def test_counts_each_track_once():
+    state = CountingState(CLASSES)
+    state.observe([row(0, 1), row(1, 2)])
+    seen = state.observe([row(0, 1), row(1, 2), row(2, 2)])
+    assert state.counts == {"bicycle": 1, "car": 2}
+    assert [(label, display_id) for _, label, display_id in seen] == [("bicycle", 1), ("car", 1), ("car", 2)]
+
+
+def test_skips_uncounted_classes():
+    state = CountingState(CLASSES)
+    assert state.observe([row(0, 7), row(1, -1)]) == []
+    assert state.counts == {"bicycle": 0, "car": 0}
+    assert state.live == {}
+
+
+def test_vote_change_moves_the_count():
+    state = CountingState(CLASSES)
+    state.observe([row(0, 2)])
+    seen = state.observe([row(0, 1)])
+    assert state.counts == {"bicycle": 1, "car": 0}
+    assert [(label, display_id) for _, label, display_id in seen] == [("bicycle", 1)]
+    # An uncounted class keeps the last counted one
+    state.observe([row(0, 7)])
+    assert state.counts == {"bicycle": 1, "car": 0}
+
+
+def test_retire_forgets_but_keeps_counts():
+    state = CountingState(CLASSES)
+    state.observe([row(0, 1)])
+    state.retire(np.array([0, 99]))
+    assert state.live == {}
+    assert state.counts == {"bicycle": 1, "car": 0}
+
+
+def test_memory_flat_over_long_runs():
+    tracker = Sort()
+    state = CountingState(CLASSES)
+    usage = []
+    tracemalloc.start()
+    try:
+        for _ in range(6):
+            for dets in synthetic_detections(300, 8, classes=CLASSES):
+                tracked = tracker.update(dets)
+                state.retire(tracker.removed_ids)
+                state.observe(tracked)
+            usage.append(tracemalloc.get_traced_memory()[0])
+    finally:
+        tracemalloc.stop()
+    assert max(usage[2:]) - usage[2] <= 8 * 1024
+    assert len(state.live) <= 16
+    assert sum(state.counts.values()) > 8
@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import pytest
+
+from logsink import LogSink
+
+NOW = datetime(2025, 6, 1, 12, 30)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_text_lines_written_on_flush(tmp_path):
+    sink = LogSink(str(tmp_path), "lisbon", "cam1", flush_seconds=3600)
+    try:
+        sink.write(NOW, "event one")
+        sink.counts(NOW, "DAY", {"car": 3, "bicycle": 1})
+        assert sink.flush()
+        assert read(tmp_path / "20250601-lisbon-cam1.log") == (
+            "event one\n2025-06-01 12:30, DAY, car:3, bicycle:1\n")
+    finally:
+        sink.close()
+
+
+def test_csv_counts_start_with_header(tmp_path):
+    sink = LogSink(str(tmp_path), "lisbon", "cam1", log_format="csv", flush_seconds=3600)
+    sink.counts(NOW, "DAY", {"car": 3})
+    sink.counts(NOW, "NIGHT", {"car": 4})
+    sink.close()
+    assert read(tmp_path / "20250601-lisbon-cam1.csv") == (
+        "timestamp,mode,car\n2025-06-01 12:30,DAY,3\n2025-06-01 12:30,NIGHT,4\n")
+
+
+def test_records_land_in_their_own_day(tmp_path):
+    sink = LogSink(str(tmp_path), "lisbon", "cam1", flush_seconds=3600)
+    sink.write(datetime(2025, 6, 1, 23, 59), "before midnight")
+    sink.write(datetime(2025, 6, 2, 0, 1), "after midnight")
+    sink.close()
+    assert read(tmp_path / "20250601-lisbon-cam1.log") == "before midnight\n"
+    assert read(tmp_path / "20250602-lisbon-cam1.log") == "after midnight\n"
+
+
+def test_max_lines_triggers_a_write(tmp_path):
+    sink = LogSink(str(tmp_path), "lisbon", "cam1", flush_seconds=3600, max_lines=2)
+    try:
+        sink.write(NOW, "a")
+        sink.write(NOW, "b")
+        with sink.cond:
+            assert sink.cond.wait_for(lambda: sink._written >= 1, 5)
+        assert read(tmp_path / "20250601-lisbon-cam1.log") == "a\nb\n"
+    finally:
+        sink.close()
+
+
+def test_closed_sink_rejects_writes(tmp_path):
+    sink = LogSink(str(tmp_path), "lisbon", "cam1")
+    sink.close()
+    with pytest.raises(ValueError):
+        sink.write(NOW, "late")
+
+
+def test_unknown_options_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        LogSink(str(tmp_path), "lisbon", "cam1", log_format="json")
+    with pytest.raises(ValueError):
+        LogSink(str(tmp_path), "lisbon", "cam1", fsync="always")
+
+
+def test_counts_written_without_flush(tmp_path):
+    sink = LogSink(str(tmp_path), "lisbon", "cam1", flush_seconds=3600)
+    try:
+        sink.counts(NOW, "DAY", {"car": 1})
+        with sink.cond:
+            assert sink.cond.wait_for(lambda: sink._written >= 1, 5)
+        assert read(tmp_path / "20250601-lisbon-cam1.log") == "2025-06-01 12:30, DAY, car:1\n"
+    finally:
+        sink.close()
+
+
+def test_close_reports_lines_it_cannot_write(tmp_path, capsys):
+    sink = LogSink(str(tmp_path), "lisbon", "cam1", flush_seconds=3600)
+    # A directory where the log file should be makes every write fail
+    (tmp_path / "20250601-lisbon-cam1.log").mkdir()
+    sink.write(NOW, "a")
+    sink.write(NOW, "b")
+    sink.close()
+    assert "2 lines that could not be written" in capsys.readouterr().out
+
+
+def test_full_buffer_drops_and_reports_oldest(tmp_path, capsys):
+    sink = LogSink(str(tmp_path), "lisbon", "cam1", flush_seconds=3600, max_buffered=2)
+    try:
+        for line in ("a", "b", "c"):
+            sink.write(NOW, line)
+        assert sink.dropped == 1
+        assert sink.flush()
+        assert read(tmp_path / "20250601-lisbon-cam1.log") == "b\nc\n"
+        assert "dropped the 1 oldest" in capsys.readouterr().out
+    finally:
+        sink.close()
@@ -0,0 +1,45 @@
+import numpy as np
+
+from pipeline import Pipeline
+
+
+class FrameList:
+    def __init__(self, frames):
+        self.frames = list(frames)
+
+    def read(self):
+        if not self.frames:
+            return False, None
+        return True, self.frames.pop(0)
+
+
+class FlagGate:
+    """Reports motion on the frames whose first pixel is set."""
+
+    def __init__(self):
+        self.seen = 0
+
+    def update(self, frame):
+        self.seen += 1
+        return bool(frame[0, 0])
+
+
+class CountingDetector:
+    def __init__(self):
+        self.calls = 0
+
+    def detect(self, frame):
+        self.calls += 1
+        return np.empty((0, 6), dtype=np.float32)
+
+
+def test_gate_sees_skipped_frames():
+    frames = [np.zeros((4, 4), dtype=np.uint8) for _ in range(12)]
+    frames[5][0, 0] = 1  # motion on a frame the skip would not send
+    gate, detector = FlagGate(), CountingDetector()
+    pipeline = Pipeline(FrameList(frames), detector, frame_skip=4, policy="block", gate=gate).start()
+    indices = [index for index, _, _ in pipeline]
+    pipeline.stop()
+    assert gate.seen == 12
+    assert detector.calls == 1
+    assert 5 in indices or 8 in indices
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+import sort
+from sort import KalmanBoxBank, Sort, SOLVERS, iou_batch, iou
+
+BOXES = [[100, 50, 140, 130], [104, 52, 144, 132], [109, 53, 149, 134], [113, 55, 154, 136]]
+
+# State and covariance diagonal after the predict/update sequence in test_kalman_matches_filterpy,
+# produced by the original filterpy KalmanFilter setup of SORT
+FILTERPY_X = [138.206464237, 97.2163604775, 3341.9454441726, 0.5004159135,
+              4.6751603119, 1.7704143099, 40.2917366991]
+FILTERPY_P_DIAG = [3.5648091783, 3.5648091783, 16.4901942489, 4.262201146,
+                   0.861100859, 0.861100859, 2.3395164261]
+
+
+def test_iou_batch_matches_pairwise():
+    a = np.array([[0, 0, 10, 10], [5, 5, 15, 15], [20, 20, 30, 30]], dtype=float)
+    b = np.array([[0, 0, 10, 10], [0, 0, 5, 5]], dtype=float)
+    out = iou_batch(a, b)
+    assert out.shape == (3, 2)
+    assert out[0, 0] == pytest.approx(1.0)
+    assert out[1, 0] == pytest.approx(25 / 175)
+    assert out[0, 1] == pytest.approx(0.25)
+    assert out[2].tolist() == [0.0, 0.0]
+    for i in range(len(a)):
+        for j in range(len(b)):
+            assert iou(a[i], b[j]) == pytest.approx(out[i, j])
+
+
+def test_iou_batch_empty_and_degenerate():
+    assert iou_batch(np.empty((0, 4)), np.ones((3, 4))).shape == (0, 3)
+    assert iou_batch([], []).shape == (0, 0)
+    # Zero-area boxes give 0, not nan
+    assert iou_batch([[1, 1, 1, 1]], [[1, 1, 1, 1]])[0, 0] == 0.0
+
+
+def test_kalman_matches_filterpy():
+    bank = KalmanBoxBank()
+    bank.add(np.array([BOXES[0] + [0.9]], dtype=float))
+    for box in BOXES[1:]:
+        bank.predict()
+        bank.update(np.array([0]), np.array([box + [0.9]], dtype=float))
+    bank.predict()
+    np.testing.assert_allclose(bank.x[0], FILTERPY_X, rtol=1e-9)
+    np.testing.assert_allclose(np.diag(bank.P[0]), FILTERPY_P_DIAG, rtol=1e-9)
+    assert bank.hits[0] == 3
+
+
+def test_kalman_class_vote_weighted_by_confidence():
+    bank = KalmanBoxBank()
+    bank.add(np.array([[0, 0, 10, 10, 0.9, 2]], dtype=float))
+    bank.update(np.array([0]), np.array([[0, 0, 10, 10, 0.4, 5]], dtype=float))
+    bank.update(np.array([0]), np.array([[0, 0, 10, 10, 0.4, 5]], dtype=float))
+    assert bank.get_class().tolist() == [2]
+    bank.update(np.array([0]), np.array([[0, 0, 10, 10, 0.4, 5]], dtype=float))
+    assert bank.get_class().tolist() == [5]
+
+
+@pytest.mark.parametrize("solver", list(SOLVERS))
+def test_solvers_match_best_pairs(solver):
+    iou_matrix = np.array([[0.9, 0.0, 0.0],
+                           [0.0, 0.2, 0.6],
+                           [0.0, 0.5, 0.0]])
+    matches = SOLVERS[solver](iou_matrix, 0.3)
+    assert sorted(map(tuple, matches.tolist())) == [(0, 0), (1, 2), (2, 1)]
+
+
+@pytest.mark.parametrize("solver", list(SOLVERS))
+def test_solvers_respect_threshold(solver):
+    assert SOLVERS[solver](np.full((2, 2), 0.1), 0.3).shape == (0, 2)
+
+
+def test_hungarian_beats_greedy_when_contested():
+    # Greedy takes (0, 0) first and leaves detection 1 unmatched
+    iou_matrix = np.array([[0.9, 0.8],
+                           [0.7, 0.0]])
+    assert len(SOLVERS['greedy'](iou_matrix, 0.3)) == 1
+    assert sorted(map(tuple, SOLVERS['hungarian'](iou_matrix, 0.3).tolist())) == [(0, 1), (1, 0)]
+
+
+def test_hungarian_components_match_single_solve(monkeypatch):
+    rng = np.random.default_rng(0)
+    boxes = rng.uniform(0, 600, (80, 2))
+    dets = np.hstack((boxes, boxes + 40))
+    trks = dets + rng.normal(0, 3, dets.shape)
+    iou_matrix = iou_batch(dets, trks)
+    single = SOLVERS['hungarian'](iou_matrix, 0.3)
+    monkeypatch.setattr(sort, "COMPONENT_SPLIT_SIZE", 0)
+    split = SOLVERS['hungarian'](iou_matrix, 0.3)
+    assert len(single) == 80
+    assert sorted(map(tuple, split.tolist())) == sorted(map(tuple, single.tolist()))
+
+
+def test_sort_tracks_and_retires():
+    tracker = Sort(max_age=2, min_hits=1)
+    for f in range(5):
+        out = tracker.update(np.array([[10 + 2 * f, 10, 50 + 2 * f, 90, 0.9, 1]]))
+        assert out[:, 4].tolist() == [0]
+        assert out[:, 5].tolist() == [1]
+    for _ in range(3):
+        tracker.update()
+    assert tracker.removed_ids.tolist() == [0]
+    assert len(tracker.trackers) == 0
+
+
+def test_sort_max_age_counts_camera_frames():
+    tracker = Sort(max_age=5, min_hits=1)
+    tracker.update(np.array([[10, 10, 50, 90, 0.9, 1]]), dt=2)
+    # Two missed inferences at a skip of 2 keep the track; a third (6 frames) retires it
+    tracker.update(dt=2)
+    tracker.update(dt=2)
+    assert len(tracker.trackers) == 1
+    tracker.update(dt=2)
+    assert tracker.removed_ids.tolist() == [0]
+    # A skip above max_age still tolerates one miss
+    tracker.update(np.array([[10, 10, 50, 90, 0.9, 1]]), dt=8)
+    tracker.update(dt=8)
+    assert len(tracker.trackers) == 1
+    tracker.update(dt=8)
+    assert len(tracker.trackers) == 0
+
+
+def test_sort_low_confidence_never_starts_a_track():
+    tracker = Sort(min_hits=1)
+    tracker.update(np.array([[0, 0, 40, 80, 0.3, 1]]))
+    assert len(tracker.trackers) == 0
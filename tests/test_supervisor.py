@@ -0,0 +1,28 @@
+import threading
+import time
+
+from supervisor import Supervisor
+
+
+def test_timer_from_another_thread_wakes_the_loop():
+    supervisor = Supervisor(watchdog_seconds=30)
+    fired = []
+
+    def schedule():
+        time.sleep(0.1)
+        supervisor.call_later(0.05, lambda: (fired.append(time.monotonic()), supervisor.stop()))
+
+    start = time.monotonic()
+    threading.Thread(target=schedule).start()
+    supervisor.run()
+    assert fired and fired[0] - start < 5
+
+
+def test_timers_run_in_order():
+    supervisor = Supervisor(watchdog_seconds=0.1)
+    order = []
+    supervisor.call_later(0.02, lambda: order.append(2))
+    supervisor.call_later(0.01, lambda: order.append(1))
+    supervisor.call_later(0.03, supervisor.stop)
+    supervisor.run()
+    assert order == [1, 2]